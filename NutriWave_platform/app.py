@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 import streamlit as st
 import json
+import math
 from datetime import datetime
+from uuid import uuid4
 import pandas as pd
 import hmac
 
@@ -13,8 +15,8 @@ from core.storage import (
     upsert_rheo_method, delete_rheo_method,
     upsert_supplier, delete_supplier,
     upsert_formulation, delete_formulation,
-    append_run, iter_runs,
-    append_model, get_latest_model, append_qc_feedback, append_batch_sop_lock
+    append_run, iter_runs_since,
+    save_model, get_latest_model, append_qc_feedback, append_batch_sop_lock
     ,
     # New Admin DB CRUD
     upsert_supplier2, delete_supplier2,
@@ -26,15 +28,20 @@ from core.storage import (
     upsert_material_lot, delete_material_lot,
     upsert_rheo_setup, delete_rheo_setup,
     upsert_formulation2, delete_formulation2,
-    upsert_formulation_line, delete_formulation_line,
+    delete_formulation_line,
     upsert_process, delete_process,
     upsert_run2, delete_run2,
     upsert_run_result, delete_run_result,
     upsert_model_run, delete_model_run,
-    upsert_model_prediction, delete_model_prediction
+    upsert_model_prediction, delete_model_prediction,
+    upsert_many,
+    invalidate_storage_cache,
+    lines_for_formulation,
+    ingredient_prices,
 )
-from core.modeling import train_surrogate
-from core.engine import UserRequest, generate_candidates, resolve_structure_kpi, simplify_candidate, evaluate_qc_feedback, recalibrate_from_feedback
+from core.modeling import train_surrogate, update_surrogate, has_stats
+from core.feature_view import train_surrogate_from_view
+from core.engine import UserRequest, generate_candidates, resolve_structure_kpi, simplify_candidate, evaluate_qc_feedback, recalibrate_from_feedback, cache_stats, search_formulations, propose_doe_batch, PARETO_OBJECTIVES, DEFAULT_PARETO_OBJECTIVES
 
 st.set_page_config(page_title="NutriWave", page_icon="🌱", layout="wide")
 
@@ -175,6 +182,27 @@ I18N = {
     "fit_title": {"zh": "Row5：根据 Row4 Runs 自动拟合代理模型", "en": "Row5: Fit surrogate model from Row4 runs"},
     "gate_full": {"zh": "训练时启用质量门槛（full regime + torque_ok）", "en": "Use quality gate (full regime + torque_ok)"},
     "alpha": {"zh": "Ridge 正则系数 alpha", "en": "Ridge alpha"},
+    "train_view_btn": {"zh": "用新库（Runs + Results 特征视图）训练 surrogate_admin_v1", "en": "Train surrogate_admin_v1 from the Admin DB run feature view"},
+    "incremental_fit": {"zh": "增量训练（只处理上次训练后新增的 runs）", "en": "Incremental fit (only runs added since the last fit)"},
+    "auto_alpha": {"zh": "自动选择 alpha（留一法交叉验证）", "en": "Auto-select alpha (leave-one-out CV)"},
+    "ensemble_size": {"zh": "集成模型数量（bootstrap，0 = 不使用；用于预测区间与 LCB 排序）", "en": "Ensemble size (bootstrap, 0 = off; for prediction intervals and LCB ranking)"},
+    "prediction_cache": {"zh": "预测缓存命中统计", "en": "Prediction cache hit/miss counters"},
+    "grid_search": {"zh": "网格搜索配方（蛋白 × 甜味剂 × 稳定剂 × 菌种，数万组合）", "en": "Grid search formulations (protein × sweetener × stabilizer × strain combo)"},
+    "pareto_mode": {"zh": "多目标 Pareto 前沿（含供应商单价成本）", "en": "Multi-objective Pareto front (incl. supplier cost)"},
+    "pareto_objectives": {"zh": "Pareto 目标", "en": "Pareto objectives"},
+    "pareto_front": {"zh": "Pareto 前沿（{n} 个非支配配方）", "en": "Pareto front ({n} non-dominated formulations)"},
+    "pareto_unpriced": {
+        "zh": "以下配方物料没有单价，成本按 0 计：{ids}。请在物料目录中为对应物料填写 ingredient_id。",
+        "en": "No unit price for: {ids} (costed at 0). Link the admin materials to them via ingredient_id in the Materials Catalog.",
+    },
+    "pareto_no_cost": {"zh": "没有任何配方物料有单价，已去掉成本目标。", "en": "No ingredient has a price, so the cost objective was dropped."},
+    "linked_ingredient": {"zh": "对应配方物料（ingredient_id）", "en": "Recipe ingredient (ingredient_id)"},
+    "doe_title": {"zh": "下一批实验设计（贝叶斯优化，EI / UCB）", "en": "Next lab batch (Bayesian optimisation, EI / UCB)"},
+    "doe_q": {"zh": "本批实验数", "en": "Runs in batch"},
+    "doe_acquisition": {"zh": "采集函数", "en": "Acquisition"},
+    "doe_btn": {"zh": "生成实验计划（需要完整训练的 surrogate_v1）", "en": "Propose runs (needs a full-fit surrogate_v1)"},
+    "robustness_mode": {"zh": "稳健性评估（蒙特卡洛：温度 / 时间 / 投料误差 / 批次波动）", "en": "Robustness check (Monte Carlo: temperature / time / dosing error / lot variation)"},
+    "cv_curve": {"zh": "交叉验证误差曲线（RMSE vs log10 alpha）", "en": "CV error curve (RMSE vs log10 alpha)"},
     "train_btn": {"zh": "训练 / 重新训练 surrogate_v1", "en": "Train / Retrain surrogate_v1"},
     "no_runs": {"zh": "还没有足够的 runs（至少 8 条含 syneresis + overall + 配方剂量）。", "en": "Not enough usable runs yet (need ≥8 with syneresis+overall+dosages)."},
 
@@ -221,6 +249,7 @@ I18N = {
     "catalog_no": {"zh": "货号/目录号", "en": "catalog_no"},
     "typical_pack_size": {"zh": "常见包装", "en": "typical_pack_size"},
     "lead_time_days": {"zh": "交期(天)", "en": "lead_time_days"},
+    "unit_price_per_kg": {"zh": "单价（每 kg）", "en": "unit_price_per_kg"},
     "delete_material": {"zh": "删除物料", "en": "Delete material"},
     "delete_supplier_material": {"zh": "删除供货关系", "en": "Delete supplier-material"},
     "upload_materials": {"zh": "上传物料目录", "en": "Upload materials"},
@@ -793,11 +822,8 @@ elif st.session_state["prev_lang"] != lang:
             del st.session_state[kk]
     st.session_state["prev_lang"] = lang
 
-@st.cache_data
-def _load():
-    return load_data()
-
-data = _load()
+# load_data() keeps a process-wide, change-validated cache (see core/storage.py)
+data = load_data()
 
 # -----------------------------
 # Admin check (not lang-bound)
@@ -885,6 +911,13 @@ elif menu == t("nav_engine"):
                 unsafe_allow_html=True,
             )
 
+            grid_search = st.checkbox(t("grid_search"), False, key=k("grid_search"))
+            pareto = st.checkbox(t("pareto_mode"), False, key=k("pareto_mode"), disabled=not grid_search)
+            pareto_objectives = st.multiselect(
+                t("pareto_objectives"), list(PARETO_OBJECTIVES), list(DEFAULT_PARETO_OBJECTIVES),
+                key=k("pareto_objectives"), disabled=not (grid_search and pareto),
+            )
+            robustness = st.checkbox(t("robustness_mode"), False, key=k("robustness_mode"))
             go = st.button(t("generate"), type="primary", use_container_width=True, key=k("go"))
 
         with col2:
@@ -946,10 +979,39 @@ elif menu == t("nav_engine"):
                 brief=brief,
                 customer_profile=customer_profile,
             )
-            cands = generate_candidates(data, req, model=model, k=3)
+            search_space = {}
+            front = None
+            st.session_state[_latest_candidates_key() + "_pareto"] = None
+            st.session_state[_latest_candidates_key() + "_pareto_notes"] = []
+            if grid_search and pareto:
+                search_space = {"pareto": True, "prices": ingredient_prices(), "objectives": pareto_objectives}
+                front = search_formulations(data, req, model, **search_space)
+                notes = []
+                if front["unpriced"]:
+                    notes.append(t("pareto_unpriced").format(ids=", ".join(front["unpriced"])))
+                if "cost" in pareto_objectives and "cost" not in front["objectives"]:
+                    notes.append(t("pareto_no_cost"))
+                st.session_state[_latest_candidates_key() + "_pareto_notes"] = notes
+                st.session_state[_latest_candidates_key() + "_pareto"] = pd.DataFrame({
+                    col: front[col] for col in (
+                        "strain_combo_id", "protein_kg", "sweetener_kg", "stabilizer_kg", "water_kg",
+                        "overall", "syneresis_pct", "yield_stress_Pa", "viscosity_Pa_s", "cost_per_100kg",
+                    ) if col in front
+                })
+            cands = generate_candidates(
+                data, req, model=model, k=3, search=grid_search, search_space=search_space,
+                robustness_samples=4000 if robustness else 0, found=front,
+            )
             st.session_state[_latest_candidates_key()] = cands
             st.success(t("generated_ok"))
 
+        _front = st.session_state.get(_latest_candidates_key() + "_pareto")
+        if _front is not None:
+            st.markdown("### " + t("pareto_front").format(n=len(_front)))
+            for note in st.session_state.get(_latest_candidates_key() + "_pareto_notes") or []:
+                st.warning(note)
+            st.dataframe(_front, use_container_width=True)
+
         cands = st.session_state.get(_latest_candidates_key(), [])
         if cands:
             st.markdown("### " + ui("候选工艺窗口交付表", "Candidate process-window deliverables"))
@@ -965,6 +1027,9 @@ elif menu == t("nav_engine"):
                     ui("η 预测", "Predicted η"): sj.get("predicted_physical_kpis", {}).get("viscosity_Pa_s"),
                     ui("终止条件", "Stop condition"): sj.get("process_window", {}).get("stop_condition"),
                 })
+                if sj.get("robustness"):
+                    summary_rows[-1][ui("放行概率", "P(pass)")] = sj["robustness"].get("p_pass")
+                    summary_rows[-1][ui("约束门槛", "Binding gate")] = sj["robustness"].get("binding_gate")
             st.dataframe(pd.DataFrame(summary_rows), use_container_width=True, hide_index=True)
 
             for c in cands:
@@ -1005,16 +1070,12 @@ elif menu == t("nav_engine"):
 else:
     st.title(t("admin_title"))
     if st.button(t("refresh"), key=k("refresh")):
-        st.cache_data.clear()
-        data = _load()
+        invalidate_storage_cache()
+        data = load_data()
         st.success(t("refreshed"))
 
     # Load redesigned admin DB (separate from legacy engine DB)
-    @st.cache_data
-    def _load_admin():
-        return load_admin_db()
-
-    admin = _load_admin()
+    admin = load_admin_db()
 
     # -----------------------------
     # Upload helper
@@ -1042,9 +1103,9 @@ else:
         # default: excel
         return pd.read_excel(uploaded)
 
-    def _bulk_upsert(df: pd.DataFrame, mapping: dict, upsert_fn, id_field: str, auto_defaults=None):
+    def _bulk_upsert(df: pd.DataFrame, mapping: dict, table: str, id_field: str, auto_defaults=None):
         auto_defaults = auto_defaults or {}
-        n_ok, n_bad = 0, 0
+        recs = []
         for _, row in df.iterrows():
             raw = {str(k).strip(): row[k] for k in df.columns}
             rec = {}
@@ -1060,12 +1121,11 @@ else:
             # force str ids
             if id_field in rec and rec[id_field] is not None:
                 rec[id_field] = str(rec[id_field]).strip()
-            try:
-                upsert_fn(rec)
-                n_ok += 1
-            except Exception:
-                n_bad += 1
-        return n_ok, n_bad
+            recs.append(rec)
+        # one validated, buffered write for the whole upload
+        results = upsert_many(table, recs)
+        n_ok = sum(1 for r in results if r["ok"])
+        return n_ok, len(results) - n_ok
 
 
     def _safe_number_input(label, min_value, max_value, value, step, key):
@@ -1113,9 +1173,8 @@ else:
                     "website": "website", "网站": "website",
                     "notes": "notes", "备注": "notes",
                 }
-                ok, bad = _bulk_upsert(df, mapping, upsert_supplier2, "supplier_company_id")
+                ok, bad = _bulk_upsert(df, mapping, "suppliers2", "supplier_company_id")
                 st.success(t("upload_done").format(ok=ok, bad=bad))
-                st.cache_data.clear()
 
             with st.form(key=k("sup2_form")):
                 sid = st.text_input(t("supplier_company_id"), value=f"SUPCO-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}", key=k("sup2_id"))
@@ -1132,14 +1191,12 @@ else:
                         "notes": notes,
                     })
                     st.success(t("refreshed"))
-                    st.cache_data.clear()
 
             del_sid = st.selectbox(t("delete_supplier2"), [s.get("supplier_company_id") for s in suppliers2] or [""], key=k("del_sup2"))
             if st.button(t("delete_selected"), key=k("del_sup2_btn")):
                 if del_sid:
                     delete_supplier2(del_sid)
                     st.success(t("refreshed"))
-                    st.cache_data.clear()
 
         with right:
             st.subheader(t("contacts_title"))
@@ -1157,9 +1214,8 @@ else:
                     "email": "email", "邮箱": "email",
                     "phone": "phone", "电话": "phone", "联系电话": "phone",
                 }
-                ok, bad = _bulk_upsert(df, mapping, upsert_supplier_contact, "contact_id")
+                ok, bad = _bulk_upsert(df, mapping, "supplier_contacts", "contact_id")
                 st.success(t("upload_done").format(ok=ok, bad=bad))
-                st.cache_data.clear()
 
             supplier_ids = [s.get("supplier_company_id") for s in suppliers2]
             with st.form(key=k("contact_form")):
@@ -1179,14 +1235,12 @@ else:
                         "phone": phone,
                     })
                     st.success(t("refreshed"))
-                    st.cache_data.clear()
 
             del_cid = st.selectbox(t("delete_contact"), [c.get("contact_id") for c in contacts] or [""], key=k("del_contact"))
             if st.button(t("delete_selected"), key=k("del_contact_btn")):
                 if del_cid:
                     delete_supplier_contact(del_cid)
                     st.success(t("refreshed"))
-                    st.cache_data.clear()
 
     # -------- Materials & Supplier-Materials --------
     with tabs[1]:
@@ -1209,27 +1263,32 @@ else:
                     "spec_description": "spec_description", "规格": "spec_description", "说明": "spec_description",
                     "allergens": "allergens", "过敏原": "allergens",
                     "clean_label_tags": "clean_label_tags", "标签": "clean_label_tags",
+                    "ingredient_id": "ingredient_id", "对应配方物料": "ingredient_id",
                 }
-                ok, bad = _bulk_upsert(df, mapping, upsert_material2, "material_id")
+                ok, bad = _bulk_upsert(df, mapping, "materials2", "material_id")
                 st.success(t("upload_done").format(ok=ok, bad=bad))
-                st.cache_data.clear()
 
             with st.form(key=k("mat_form")):
                 mid = st.text_input(t("material_id"), value=f"MAT-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}", key=k("mat_id"))
                 mname = st.text_input(t("material_name"), value="", key=k("mat_name"))
                 cat = st.selectbox(t("category"), ["protein", "sweetener", "stabilizer", "water", "other"], 0, key=k("mat_cat"))
                 spec = st.text_area(t("spec_description"), value="", key=k("mat_spec"))
+                ing = st.selectbox(
+                    t("linked_ingredient"), [""] + [x.get("ingredient_id") for x in data.get("ingredients", [])], 0,
+                    key=k("mat_ing"),
+                )
                 if st.form_submit_button(t("save_upsert")):
-                    upsert_material2({"material_id": mid, "material_name": mname, "category": cat, "spec_description": spec})
+                    upsert_material2({
+                        "material_id": mid, "material_name": mname, "category": cat, "spec_description": spec,
+                        "ingredient_id": ing,
+                    })
                     st.success(t("refreshed"))
-                    st.cache_data.clear()
 
             del_mid = st.selectbox(t("delete_material"), [m.get("material_id") for m in mats] or [""], key=k("del_mat"))
             if st.button(t("delete_selected"), key=k("del_mat_btn")):
                 if del_mid:
                     delete_material2(del_mid)
                     st.success(t("refreshed"))
-                    st.cache_data.clear()
 
         with right:
             st.subheader(t("supplier_materials_title"))
@@ -1244,10 +1303,10 @@ else:
                     "catalog_no": "catalog_no", "货号": "catalog_no",
                     "typical_pack_size": "typical_pack_size", "包装": "typical_pack_size",
                     "lead_time_days": "lead_time_days", "交期天数": "lead_time_days",
+                    "unit_price_per_kg": "unit_price_per_kg", "单价": "unit_price_per_kg", "每公斤单价": "unit_price_per_kg",
                 }
-                ok, bad = _bulk_upsert(df, mapping, upsert_supplier_material, "supplier_material_id")
+                ok, bad = _bulk_upsert(df, mapping, "supplier_materials", "supplier_material_id")
                 st.success(t("upload_done").format(ok=ok, bad=bad))
-                st.cache_data.clear()
 
             material_ids = [m.get("material_id") for m in mats]
             with st.form(key=k("supm_form")):
@@ -1256,6 +1315,7 @@ else:
                 catno = st.text_input(t("catalog_no"), value="", key=k("supm_catno"))
                 pack = st.text_input(t("typical_pack_size"), value="", key=k("supm_pack"))
                 lt = st.number_input(t("lead_time_days"), 0, 365, 0, 1, key=k("supm_lt"))
+                price = st.number_input(t("unit_price_per_kg"), 0.0, 100000.0, 0.0, 0.1, key=k("supm_price"))
                 if st.form_submit_button(t("save_upsert")):
                     upsert_supplier_material({
                         "supplier_company_id": scid,
@@ -1263,16 +1323,15 @@ else:
                         "catalog_no": catno,
                         "typical_pack_size": pack,
                         "lead_time_days": int(lt),
+                        "unit_price_per_kg": float(price) if price else None,
                     })
                     st.success(t("refreshed"))
-                    st.cache_data.clear()
 
             del_smid = st.selectbox(t("delete_supplier_material"), [x.get("supplier_material_id") for x in supm] or [""], key=k("del_supm"))
             if st.button(t("delete_selected"), key=k("del_supm_btn")):
                 if del_smid:
                     delete_supplier_material(del_smid)
                     st.success(t("refreshed"))
-                    st.cache_data.clear()
 
     # -------- Strain products & components --------
     with tabs[2]:
@@ -1297,9 +1356,8 @@ else:
                     "default_dosage_max": "default_dosage_max", "默认最大剂量": "default_dosage_max",
                     "default_dosage_unit": "default_dosage_unit", "默认剂量单位": "default_dosage_unit",
                 }
-                ok, bad = _bulk_upsert(df, mapping, upsert_strain_product, "strain_product_id")
+                ok, bad = _bulk_upsert(df, mapping, "strain_products", "strain_product_id")
                 st.success(t("upload_done").format(ok=ok, bad=bad))
-                st.cache_data.clear()
 
             with st.form(key=k("sp_form")):
                 spid = st.text_input(t("strain_product_id"), value=f"SP-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}", key=k("spid"))
@@ -1320,14 +1378,12 @@ else:
                         "default_dosage_unit": dunit,
                     })
                     st.success(t("refreshed"))
-                    st.cache_data.clear()
 
             del_spid = st.selectbox(t("delete_strain_product"), [x.get("strain_product_id") for x in sp] or [""], key=k("del_spid"))
             if st.button(t("delete_selected"), key=k("del_sp_btn")):
                 if del_spid:
                     delete_strain_product(del_spid)
                     st.success(t("refreshed"))
-                    st.cache_data.clear()
 
         with right:
             st.subheader(t("strain_components_title"))
@@ -1343,9 +1399,8 @@ else:
                     "unit": "unit", "单位": "unit",
                     "test_method": "test_method", "方法": "test_method",
                 }
-                ok, bad = _bulk_upsert(df, mapping, upsert_strain_component, "strain_component_id")
+                ok, bad = _bulk_upsert(df, mapping, "strain_components", "strain_component_id")
                 st.success(t("upload_done").format(ok=ok, bad=bad))
-                st.cache_data.clear()
 
             spids = [x.get("strain_product_id") for x in sp]
             with st.form(key=k("sc_form")):
@@ -1363,14 +1418,12 @@ else:
                         "test_method": method,
                     })
                     st.success(t("refreshed"))
-                    st.cache_data.clear()
 
             del_scid = st.selectbox(t("delete_strain_component"), [x.get("strain_component_id") for x in sc] or [""], key=k("del_scid"))
             if st.button(t("delete_selected"), key=k("del_sc_btn")):
                 if del_scid:
                     delete_strain_component(del_scid)
                     st.success(t("refreshed"))
-                    st.cache_data.clear()
 
     # -------- Lots --------
     with tabs[3]:
@@ -1398,10 +1451,10 @@ else:
                 "concentration_or_purity_unit": "concentration_or_purity_unit", "纯度单位": "concentration_or_purity_unit",
                 "measured_assay_value": "measured_assay_value", "检测值": "measured_assay_value",
                 "measured_assay_unit": "measured_assay_unit", "检测单位": "measured_assay_unit",
+                "unit_price_per_kg": "unit_price_per_kg", "单价": "unit_price_per_kg", "每公斤单价": "unit_price_per_kg",
             }
-            ok, bad = _bulk_upsert(df, mapping, upsert_material_lot, "lot_id")
+            ok, bad = _bulk_upsert(df, mapping, "material_lots", "lot_id")
             st.success(t("upload_done").format(ok=ok, bad=bad))
-            st.cache_data.clear()
 
         supplier_ids = [s.get("supplier_company_id") for s in suppliers2]
         material_ids = [m.get("material_id") for m in mats]
@@ -1416,6 +1469,7 @@ else:
             mfg = st.text_input(t("manufacture_date"), value="", key=k("lot_mfg"))
             exp = st.text_input(t("expiry_date"), value="", key=k("lot_exp"))
             coa = st.text_input(t("coa_file"), value="", key=k("lot_coa"))
+            lot_price = st.number_input(t("unit_price_per_kg"), 0.0, 100000.0, 0.0, 0.1, key=k("lot_price"))
             if st.form_submit_button(t("save_upsert")):
                 rec = {
                     "lot_id": lot_id,
@@ -1425,6 +1479,7 @@ else:
                     "manufacture_date": mfg,
                     "expiry_date": exp,
                     "coa_file": coa,
+                    "unit_price_per_kg": float(lot_price) if lot_price else None,
                 }
                 if mtype == "material":
                     rec["material_id"] = mid
@@ -1432,14 +1487,12 @@ else:
                     rec["strain_product_id"] = spid
                 upsert_material_lot(rec)
                 st.success(t("refreshed"))
-                st.cache_data.clear()
 
         del_lot = st.selectbox(t("delete_lot"), [x.get("lot_id") for x in lots] or [""], key=k("del_lot"))
         if st.button(t("delete_selected"), key=k("del_lot_btn")):
             if del_lot:
                 delete_material_lot(del_lot)
                 st.success(t("refreshed"))
-                st.cache_data.clear()
 
     # -------- Rheology setups --------
     with tabs[4]:
@@ -1460,9 +1513,8 @@ else:
                 "temperature_C": "temperature_C", "温度": "temperature_C",
                 "protocol_id": "protocol_id", "协议": "protocol_id",
             }
-            ok, bad = _bulk_upsert(df, mapping, upsert_rheo_setup, "rheo_setup_id")
+            ok, bad = _bulk_upsert(df, mapping, "rheo_setups", "rheo_setup_id")
             st.success(t("upload_done").format(ok=ok, bad=bad))
-            st.cache_data.clear()
 
         with st.form(key=k("rheo_setup_form")):
             rsid = st.text_input(t("rheo_setup_id"), value=f"RS-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}", key=k("rsid"))
@@ -1483,14 +1535,12 @@ else:
                     "protocol_id": pid,
                 })
                 st.success(t("refreshed"))
-                st.cache_data.clear()
 
         del_rsid = st.selectbox(t("delete_rheo_setup"), [x.get("rheo_setup_id") for x in setups] or [""], key=k("del_rsid"))
         if st.button(t("delete_selected"), key=k("del_rsid_btn")):
             if del_rsid:
                 delete_rheo_setup(del_rsid)
                 st.success(t("refreshed"))
-                st.cache_data.clear()
 
     # -------- Formulations (header + lines) --------
     with tabs[5]:
@@ -1512,9 +1562,8 @@ else:
                 "basis": "basis", "基准": "basis",
                 "notes": "notes", "备注": "notes",
             }
-            ok, bad = _bulk_upsert(df, mapping, upsert_formulation2, "formulation_id", auto_defaults={"basis": "g_per_L"})
+            ok, bad = _bulk_upsert(df, mapping, "formulations2", "formulation_id", auto_defaults={"basis": "g_per_L"})
             st.success(t("upload_done").format(ok=ok, bad=bad))
-            st.cache_data.clear()
 
         # Active formulation selector (prevents the "no options" issue when you already have formulations)
         # We keep f2id in session_state as the single source of truth for the builder below.
@@ -1540,7 +1589,7 @@ else:
                 key=k("f2id"),
             )
             # Show associated line IDs under the formulation ID (read-only helper)
-            _line_ids_for_fid = [x.get("line_id") for x in lines if x.get("formulation_id") == fid and not x.get("is_deleted")]
+            _line_ids_for_fid = [x.get("line_id") for x in lines_for_formulation(fid)] if fid else []
             if _line_ids_for_fid:
                 st.caption(f"{t('line_id')}: {', '.join(_line_ids_for_fid[:20])}{' …' if len(_line_ids_for_fid) > 20 else ''}")
             else:
@@ -1550,14 +1599,12 @@ else:
             if st.form_submit_button(t("save_upsert")):
                 upsert_formulation2({"formulation_id": fid, "basis": basis, "notes": notes})
                 st.success(t("refreshed"))
-                st.cache_data.clear()
 
         del_fid = st.selectbox(t("delete_formulation2"), [x.get("formulation_id") for x in forms2] or [""], key=k("del_f2"))
         if st.button(t("delete_selected"), key=k("del_f2_btn")):
             if del_fid:
                 delete_formulation2(del_fid)
                 st.success(t("refreshed"))
-                st.cache_data.clear()
 
         st.markdown("---")
         st.subheader(t("formulation_lines_title"))
@@ -1577,9 +1624,8 @@ else:
                 "amount_unit": "amount_unit", "单位": "amount_unit",
                 "is_optional": "is_optional", "可选": "is_optional",
             }
-            ok, bad = _bulk_upsert(df, mapping, upsert_formulation_line, "line_id")
+            ok, bad = _bulk_upsert(df, mapping, "formulation_lines", "line_id")
             st.success(t("upload_done").format(ok=ok, bad=bad))
-            st.cache_data.clear()
         lot_ids = [x.get("lot_id") for x in lots]
         form_ids = [x.get("formulation_id") for x in forms2]
         strain_products = admin.get("strain_products", [])
@@ -1660,6 +1706,7 @@ else:
                     st.stop()
 
                 ts = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+                new_lines = []
 
                 # Write strain lines
                 for _, row in (s_df if isinstance(s_df, pd.DataFrame) else pd.DataFrame()).iterrows():
@@ -1667,7 +1714,7 @@ else:
                     if not sid:
                         continue
                     line_id = f"L-{ts}-S-{sid}"
-                    upsert_formulation_line({
+                    new_lines.append({
                         'line_id': line_id,
                         'formulation_id': fid,
                         'lot_id': lot,
@@ -1684,7 +1731,7 @@ else:
                     if not mid:
                         continue
                     line_id = f"L-{ts}-M-{mid}"
-                    upsert_formulation_line({
+                    new_lines.append({
                         'line_id': line_id,
                         'formulation_id': fid,
                         'lot_id': lot,
@@ -1695,8 +1742,8 @@ else:
                         'material_id': mid,
                     })
 
+                upsert_many("formulation_lines", new_lines)
                 st.success(t("refreshed"))
-                st.cache_data.clear()
 
 
 
@@ -1705,7 +1752,6 @@ else:
             if del_line:
                 delete_formulation_line(del_line)
                 st.success(t("refreshed"))
-                st.cache_data.clear()
 
     # -------- Runs (processes + runs) --------
     with tabs[6]:
@@ -1728,9 +1774,8 @@ else:
                 "storage_time_h": "storage_time_h", "储存时间": "storage_time_h",
                 "storage_temp_C": "storage_temp_C", "储存温度": "storage_temp_C",
             }
-            ok, bad = _bulk_upsert(df, mapping, upsert_process, "process_id")
+            ok, bad = _bulk_upsert(df, mapping, "processes", "process_id")
             st.success(t("upload_done").format(ok=ok, bad=bad))
-            st.cache_data.clear()
 
         with st.form(key=k("proc_form")):
             pid = st.text_input(t("process_id"), value=f"P-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}", key=k("pid"))
@@ -1755,14 +1800,12 @@ else:
                     "storage_temp_C": float(stT),
                 })
                 st.success(t("refreshed"))
-                st.cache_data.clear()
 
         del_pid = st.selectbox(t("delete_process"), [x.get("process_id") for x in processes] or [""], key=k("del_pid"))
         if st.button(t("delete_selected"), key=k("del_pid_btn")):
             if del_pid:
                 delete_process(del_pid)
                 st.success(t("refreshed"))
-                st.cache_data.clear()
 
         st.markdown("---")
         st.subheader(t("runs_title"))
@@ -1783,9 +1826,8 @@ else:
                 "notes": "notes", "备注": "notes",
                 "raw_files": "raw_files", "原始文件": "raw_files",
             }
-            ok, bad = _bulk_upsert(df, mapping, upsert_run2, "run_id")
+            ok, bad = _bulk_upsert(df, mapping, "runs2", "run_id")
             st.success(t("upload_done").format(ok=ok, bad=bad))
-            st.cache_data.clear()
 
         form_ids = [x.get("formulation_id") for x in admin.get("formulations2", [])]
         proc_ids = [x.get("process_id") for x in processes]
@@ -1814,14 +1856,12 @@ else:
                     "notes": notes,
                 })
                 st.success(t("refreshed"))
-                st.cache_data.clear()
 
         del_rid = st.selectbox(t("delete_run2"), [x.get("run_id") for x in runs2] or [""], key=k("del_run2"))
         if st.button(t("delete_selected"), key=k("del_run2_btn")):
             if del_rid:
                 delete_run2(del_rid)
                 st.success(t("refreshed"))
-                st.cache_data.clear()
 
     # -------- Results --------
     with tabs[7]:
@@ -1852,9 +1892,8 @@ else:
                 "measured_at": "measured_at", "测量时间": "measured_at",
                 "analyst": "analyst", "分析者": "analyst",
             }
-            ok, bad = _bulk_upsert(df, mapping, upsert_run_result, "run_id")
+            ok, bad = _bulk_upsert(df, mapping, "run_results", "run_id")
             st.success(t("upload_done").format(ok=ok, bad=bad))
-            st.cache_data.clear()
 
         run_ids = [x.get("run_id") for x in admin.get("runs2", [])]
         with st.form(key=k("res_form")):
@@ -1909,14 +1948,12 @@ else:
                     "measured_at": datetime.utcnow().isoformat(),
                 })
                 st.success(t("refreshed"))
-                st.cache_data.clear()
 
         del_res = st.selectbox(t("delete_result"), [x.get("run_id") for x in res] or [""], key=k("del_res"))
         if st.button(t("delete_selected"), key=k("del_res_btn")):
             if del_res:
                 delete_run_result(del_res)
                 st.success(t("refreshed"))
-                st.cache_data.clear()
 
     # -------- Models (Row6) --------
     with tabs[8]:
@@ -1939,9 +1976,8 @@ else:
                     "artifact_path": "artifact_path", "模型文件": "artifact_path",
                     "trained_at": "trained_at", "训练时间": "trained_at",
                 }
-                ok, bad = _bulk_upsert(df, mapping, upsert_model_run, "model_run_id")
+                ok, bad = _bulk_upsert(df, mapping, "model_runs", "model_run_id")
                 st.success(t("upload_done").format(ok=ok, bad=bad))
-                st.cache_data.clear()
 
             with st.form(key=k("mr_form")):
                 mid = st.text_input(t("model_run_id"), value=f"MR-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}", key=k("mr_id"))
@@ -1971,14 +2007,12 @@ else:
                         "trained_at": datetime.utcnow().isoformat(),
                     })
                     st.success(t("refreshed"))
-                    st.cache_data.clear()
 
             del_mrid = st.selectbox(t("delete_model_run"), [x.get("model_run_id") for x in mr] or [""], key=k("del_mrid"))
             if st.button(t("delete_selected"), key=k("del_mrid_btn")):
                 if del_mrid:
                     delete_model_run(del_mrid)
                     st.success(t("refreshed"))
-                    st.cache_data.clear()
 
         with right:
             st.subheader(t("model_predictions_title"))
@@ -1994,9 +2028,8 @@ else:
                     "y_true": "y_true", "真实": "y_true",
                     "created_at": "created_at", "创建时间": "created_at",
                 }
-                ok, bad = _bulk_upsert(df, mapping, upsert_model_prediction, "prediction_id")
+                ok, bad = _bulk_upsert(df, mapping, "model_predictions", "prediction_id")
                 st.success(t("upload_done").format(ok=ok, bad=bad))
-                st.cache_data.clear()
 
             model_run_ids = [x.get("model_run_id") for x in mr]
             run_ids = [x.get("run_id") for x in admin.get("runs2", [])]
@@ -2016,32 +2049,91 @@ else:
                         "created_at": datetime.utcnow().isoformat(),
                     })
                     st.success(t("refreshed"))
-                    st.cache_data.clear()
 
             del_pid = st.selectbox(t("delete_model_prediction"), [x.get("prediction_id") for x in mp] or [""], key=k("del_pred"))
             if st.button(t("delete_selected"), key=k("del_pred_btn")):
                 if del_pid:
                     delete_model_prediction(del_pid)
                     st.success(t("refreshed"))
-                    st.cache_data.clear()
 
     # -------- Legacy Row5 Fit (unchanged) --------
     with tabs[9]:
         st.subheader(t("fit_title"))
-        runs = iter_runs(limit=10000)
         gate_full = st.checkbox(t("gate_full"), True, key=k("gate_full"))
-        alpha = st.number_input(t("alpha"), 0.01, 1000.0, 1.0, 0.1, key=k("alpha"))
+        auto_alpha = st.checkbox(t("auto_alpha"), False, key=k("auto_alpha"))
+        alpha = st.number_input(t("alpha"), 0.01, 1000.0, 1.0, 0.1, key=k("alpha"), disabled=auto_alpha)
+        incremental = st.checkbox(t("incremental_fit"), True, key=k("incremental_fit"))
+        ensemble_size = int(st.number_input(t("ensemble_size"), 0, 64, 0, 1, key=k("ensemble_size")))
 
         if st.button(t("train_btn"), key=k("train_btn")):
-            model = train_surrogate(runs, alpha=float(alpha), gate_full=gate_full)
+            _alpha = "auto" if auto_alpha else float(alpha)
+            prev = get_latest_model("surrogate_v1")
+            model = None
+            # ensemble members are refit from the rows, so they always take the full path
+            if incremental and not ensemble_size and has_stats(prev) and prev.get("gate_full") == gate_full:
+                # only runs appended since the previous fit are read and folded in
+                new_runs, cursor, resumed = iter_runs_since(prev.get("runs_cursor"))
+                if resumed:
+                    model = update_surrogate(prev, new_runs, alpha=_alpha)
+            if model is None:
+                runs, cursor, _ = iter_runs_since(None)
+                model = train_surrogate(runs, alpha=_alpha, gate_full=gate_full, keep_stats=True, ensemble=ensemble_size)
+            model["runs_cursor"] = cursor
             model["model_type"] = "surrogate_v1"
-            model["model_id"] = datetime.utcnow().strftime("SURR-%Y%m%d-%H%M%S")
+            model["model_id"] = datetime.utcnow().strftime("SURR-%Y%m%d-%H%M%S-") + uuid4().hex[:8]
             model["n_used"] = (model.get("schema") or {}).get("n_used", 0)
-            append_model(model)
+            save_model(model)
+            st.success(f"{model['model_id']}  OK={model.get('ok')}  n_used={model.get('n_used')}")
+
+        # Admin DB path: runs2 + run_results + lines/lots/processes via the materialised feature view
+        if st.button(t("train_view_btn"), key=k("train_view_btn")):
+            model = train_surrogate_from_view(alpha="auto" if auto_alpha else float(alpha))
+            model["model_type"] = "surrogate_admin_v1"
+            model["model_id"] = datetime.utcnow().strftime("SURRA-%Y%m%d-%H%M%S-") + uuid4().hex[:8]
+            model["n_used"] = (model.get("schema") or {}).get("n_used", 0)
+            save_model(model)
             st.success(f"{model['model_id']}  OK={model.get('ok')}  n_used={model.get('n_used')}")
 
         latest = get_latest_model("surrogate_v1")
         if latest:
-            st.json({k2: latest.get(k2) for k2 in ["model_id", "ok", "n_used", "rmse_syneresis", "rmse_overall", "alpha", "gate_full"]})
+            _shown = ["model_id", "ok", "n_used", "rmse_syneresis", "rmse_overall", "alpha", "gate_full", "ensemble_size", "artifact_path"]
+            _shown += [k2 for k2 in latest if k2.startswith("cv_rmse_at_alpha_")]
+            st.json({k2: latest.get(k2) for k2 in _shown})
+            st.caption(t("prediction_cache"))
+            st.json(cache_stats())
+            if latest.get("cv_alphas"):
+                st.caption(t("cv_curve"))
+                st.line_chart(pd.DataFrame(
+                    {tt: latest.get(f"cv_rmse_{tt}") for tt in latest.get("targets", []) if latest.get(f"cv_rmse_{tt}")},
+                    index=[round(math.log10(a), 2) for a in latest["cv_alphas"]],
+                ))
+
+            # Next lab plate: Bayesian optimisation over the surrogate's posterior
+            st.markdown("#### " + t("doe_title"))
+            d1, d2, d3 = st.columns(3)
+            doe_texture = d1.selectbox(t("texture"), ["soft", "thick", "refreshing"], 1, key=k("doe_texture"))
+            doe_q = int(d2.number_input(t("doe_q"), 1, 96, 24, 1, key=k("doe_q")))
+            doe_acq = d3.selectbox(t("doe_acquisition"), ["ei", "ucb"], 0, key=k("doe_acq"))
+            if st.button(t("doe_btn"), key=k("doe_btn"), disabled=not has_stats(latest)):
+                observed = [
+                    float(r["sensory"]["overall"]) * 10 - float(r["rheology"]["syneresis_pct"])
+                    for r in iter_runs_since(None)[0]
+                    if (r.get("sensory") or {}).get("overall") is not None
+                    and (r.get("rheology") or {}).get("syneresis_pct") is not None
+                ]
+                plans = propose_doe_batch(
+                    data, _default_engine_request(texture=doe_texture), latest,
+                    q=doe_q, acquisition=doe_acq, best=max(observed) if observed else None,
+                )
+                st.dataframe(pd.DataFrame([{
+                    "#": pl["doe_rank"],
+                    "strain_combo_id": pl["strain_combo_id"],
+                    **{it["ingredient_id"]: it["dosage_kg"] for it in pl["formulation"]["ingredients"]},
+                    "end_ph": pl["end_ph"],
+                    "ferm_time_h": pl["ferm_time_h"],
+                    "score_mean": round(pl["predicted_score"], 2),
+                    "score_std": round(pl["predicted_score_std"], 3),
+                    "acquisition": round(pl["acquisition"], 4),
+                } for pl in plans]), use_container_width=True)
         else:
             st.warning(t("no_runs"))
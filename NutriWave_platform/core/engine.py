@@ -2,13 +2,20 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Sequence
+from bisect import bisect_right
 import random
 
+import numpy as np
+
 try:  # works both in the original package layout and in this uploaded flat layout
-    from core.modeling import predict
+    from core.modeling import (
+        PREDICTION_CACHE, CompiledSurrogate, LRUCache, PosteriorSurrogate, formulation_hash, propose_batch,
+    )
 except ModuleNotFoundError:  # pragma: no cover - local artifact convenience only
-    from modeling import predict
+    from modeling import (
+        PREDICTION_CACHE, CompiledSurrogate, LRUCache, PosteriorSurrogate, formulation_hash, propose_batch,
+    )
 
 
 @dataclass
@@ -141,6 +148,37 @@ def _form_dosages(formulation: Dict[str, Any]) -> Dict[str, float]:
     return {"protein_kg": protein_kg, "sweetener_kg": sweetener_kg, "stabilizer_kg": stabilizer_kg}
 
 
+def _physical_kpi_arrays(p: Dict[str, Any], protein_kg, stabilizer_kg, sy_risk):
+    """Yield stress / viscosity estimates; scalars or equally shaped arrays (the grid search path)."""
+    stabilizer_delta = np.asarray(stabilizer_kg, dtype=float) - float(p["reference_stabilizer_kg"])
+    protein_delta = np.asarray(protein_kg, dtype=float) - 8.0
+
+    yield_min = float(p["yield_stress_min_pa"])
+    viscosity_min = float(p["viscosity_min_pa_s"])
+
+    # Conservative deterministic estimates: enough to make the prototype demo factory physics
+    # without pretending to be a validated mechanistic model.
+    yield_stress_pa = yield_min + 2.5 + 18.0 * stabilizer_delta + 0.10 * protein_delta
+    viscosity_pa_s = viscosity_min + 0.12 + 0.90 * stabilizer_delta + 0.015 * protein_delta
+
+    # If the trained surrogate predicts high syneresis, show some structural risk instead of
+    # blindly declaring a pass. This keeps the demo more credible.
+    yield_stress_pa = np.where(sy_risk, yield_stress_pa - 1.5, yield_stress_pa)
+    viscosity_pa_s = np.where(sy_risk, viscosity_pa_s - 0.08, viscosity_pa_s)
+
+    return np.maximum(0.0, yield_stress_pa), np.maximum(0.0, viscosity_pa_s)
+
+
+# Physical KPIs depend on the texture preset, the positional dosages and only whether
+# the predicted syneresis exceeds the preset limit, so that is the whole cache key.
+_KPI_CACHE = LRUCache(4096)
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Hit / miss counters of the surrogate prediction cache and the physical KPI cache."""
+    return {"predictions": PREDICTION_CACHE.stats(), "physical_kpis": _KPI_CACHE.stats()}
+
+
 def estimate_physical_kpis(
     texture: str,
     formulation: Dict[str, Any],
@@ -153,30 +191,19 @@ def estimate_physical_kpis(
     from the same candidate formulation so the UI can speak in plant/process-control terms.
     """
     p = _preset(texture)
-    d = _form_dosages(formulation)
-    stabilizer_delta = d["stabilizer_kg"] - float(p["reference_stabilizer_kg"])
-    protein_delta = d["protein_kg"] - 8.0
-
-    yield_min = float(p["yield_stress_min_pa"])
-    viscosity_min = float(p["viscosity_min_pa_s"])
-
-    # Conservative deterministic estimates: enough to make the prototype demo factory physics
-    # without pretending to be a validated mechanistic model.
-    yield_stress_pa = yield_min + 2.5 + 18.0 * stabilizer_delta + 0.10 * protein_delta
-    viscosity_pa_s = viscosity_min + 0.12 + 0.90 * stabilizer_delta + 0.015 * protein_delta
-
-    # If the trained surrogate predicts high syneresis, show some structural risk instead of
-    # blindly declaring a pass. This keeps the demo more credible.
     sy_pred = None if not predicted else predicted.get("syneresis_pct")
-    if sy_pred is not None and sy_pred > float(p["syneresis_pct_max"]):
-        yield_stress_pa -= 1.5
-        viscosity_pa_s -= 0.08
+    sy_risk = None if sy_pred is None else sy_pred > float(p["syneresis_pct_max"])
+    key = (texture, formulation_hash(formulation), sy_risk)
+    hit = _KPI_CACHE.get(key)
+    if hit is not None:
+        return dict(hit)
 
-    yield_stress_pa = max(0.0, yield_stress_pa)
-    viscosity_pa_s = max(0.0, viscosity_pa_s)
-
-    pass_structure = yield_stress_pa > yield_min and viscosity_pa_s > viscosity_min
-    return {
+    d = _form_dosages(formulation)
+    yield_stress_pa, viscosity_pa_s = (
+        float(v) for v in _physical_kpi_arrays(p, d["protein_kg"], d["stabilizer_kg"], bool(sy_risk))
+    )
+    pass_structure = yield_stress_pa > float(p["yield_stress_min_pa"]) and viscosity_pa_s > float(p["viscosity_min_pa_s"])
+    out = {
         "yield_stress_Pa": round(yield_stress_pa, 1),
         "rheological_viscosity_Pa_s": round(viscosity_pa_s, 2),
         "syneresis_pct_max": float(p["syneresis_pct_max"]),
@@ -187,6 +214,8 @@ def estimate_physical_kpis(
             "structure KPI risk; widen DoE or increase stabilizer/EPS contribution before scale-up"
         ),
     }
+    _KPI_CACHE.put(key, out)
+    return dict(out)
 
 
 def build_process_window(
@@ -272,6 +301,115 @@ def build_process_window(
     }
 
 
+# Release gates checked by the robustness simulation, as in qc_gates["structure_release"].
+RELEASE_GATES = ("yield_stress_Pa", "rheological_viscosity_Pa_s", "syneresis_pct")
+
+
+def robustness_scores(
+    candidates: List[Dict[str, Any]],
+    texture: str,
+    model: Optional[Dict[str, Any]] = None,
+    n_samples: int = 4000,
+    seed: int = 0,
+    temp_sd_C: float = 0.3,
+    q10: float = 2.0,
+    dosing_cv: float = 0.02,
+    lot_cv: float = 0.05,
+    end_ph_sd: float = 0.03,
+) -> List[Dict[str, Any]]:
+    """Monte Carlo P(pass structure_release) of each candidate's process window.
+
+    Every scenario draws a fermentation temperature and time uniformly inside
+    the texture preset's window, with a temperature control error of
+    N(0, temp_sd_C). It also draws a per-ingredient dosing error
+    (multiplicative, dosing_cv), a lot-to-lot functionality factor on the
+    protein and stabilizer (lot_cv), and end-pH scatter around 4.6. Water
+    closes the 100 kg balance. The surrogate has no temperature input, so
+    temperature acts through the effective fermentation time,
+    time * q10 ** ((T - window mid) / 10).
+
+    Scenarios are scored in one batch per candidate. The surrogate gives
+    syneresis: one random ensemble member per scenario when the model has
+    members, plus residual noise of the training RMSE. _physical_kpi_arrays
+    gives yield stress and viscosity. A scenario passes when all three
+    release gates hold. Without a trained model the syneresis gate is not
+    evaluated. Each candidate gets its own child of SeedSequence(seed), so
+    results are reproducible and do not depend on how candidates are split
+    across workers.
+
+    Returns per candidate: n_samples, seed, p_pass, p_fail per gate,
+    binding_gate (the gate failing most often, None if none fails) and
+    5/50/95% quantiles of each KPI.
+    """
+    p = _preset(texture)
+    temp_min, temp_max = (float(v) for v in p["fermentation_temp_C"])
+    time_min, time_max = (float(v) for v in p["fermentation_time_h"])
+    gates = {
+        "yield_stress_Pa": float(p["yield_stress_min_pa"]),
+        "rheological_viscosity_Pa_s": float(p["viscosity_min_pa_s"]),
+        "syneresis_pct": float(p["syneresis_pct_max"]),
+    }
+    trained = bool(model and model.get("ok"))
+    compiled = CompiledSurrogate(model) if trained else None
+    n = int(n_samples)
+    out = []
+    for cand, child in zip(candidates, np.random.SeedSequence(seed).spawn(len(candidates))):
+        rng = np.random.default_rng(child)
+        ings = [it for it in (cand.get("formulation") or {}).get("ingredients", [])]
+        nominal = np.array([float(it.get("dosage_kg", 0.0)) for it in ings])
+        is_water = np.array([it.get("ingredient_id") == "WATER" for it in ings], dtype=bool)
+        solids = np.nonzero(~is_water)[0]
+
+        temp = rng.uniform(temp_min, temp_max, n) + rng.normal(0.0, temp_sd_C, n)
+        time_h = rng.uniform(time_min, time_max, n) * q10 ** ((temp - 0.5 * (temp_min + temp_max)) / 10.0)
+        end_ph = 4.6 + rng.normal(0.0, end_ph_sd, n)
+        D = np.tile(nominal, (n, 1))
+        D[:, solids] *= rng.normal(1.0, dosing_cv, (n, len(solids)))
+        D = np.clip(D, 0.0, None)
+        if is_water.any():
+            w = np.nonzero(is_water)[0][-1]
+            D[:, w] = 0.0
+            D[:, w] = np.clip(100.0 - D.sum(axis=1), 0.0, None)
+        # functional strength of this lot (protein = 1st, stabilizer = 3rd non-water slot, as in _form_dosages)
+        lot = rng.normal(1.0, lot_cv, (n, 2))
+        protein = D[:, solids[0]] * lot[:, 0] if len(solids) > 0 else np.zeros(n)
+        stabilizer = D[:, solids[2]] * lot[:, 1] if len(solids) > 2 else np.zeros(n)
+
+        kpi: Dict[str, np.ndarray] = {}
+        sy_risk: Any = False
+        if trained:
+            X = compiled.design_matrix(
+                [cand.get("strain_combo_id") or ""] * n, [it.get("ingredient_id") for it in ings], D, end_ph, time_h
+            )
+            if compiled.has_ensemble:
+                member = rng.integers(0, compiled.n_members, n)
+                Wm = compiled.E.reshape(compiled.n_features, compiled.n_members, -1)[:, :, 0]
+                sy = np.einsum("ij,ji->i", X, Wm[:, member])
+            else:
+                sy = X @ compiled.W[:, 0]
+            kpi["syneresis_pct"] = sy + rng.normal(0.0, compiled.noise[0] or 0.0, n)
+            sy_risk = kpi["syneresis_pct"] > gates["syneresis_pct"]
+        kpi["yield_stress_Pa"], kpi["rheological_viscosity_Pa_s"] = _physical_kpi_arrays(p, protein, stabilizer, sy_risk)
+
+        fail = {
+            "yield_stress_Pa": kpi["yield_stress_Pa"] < gates["yield_stress_Pa"],
+            "rheological_viscosity_Pa_s": kpi["rheological_viscosity_Pa_s"] < gates["rheological_viscosity_Pa_s"],
+        }
+        if trained:
+            fail["syneresis_pct"] = kpi["syneresis_pct"] > gates["syneresis_pct"]
+        any_fail = np.any(np.stack(list(fail.values())), axis=0)
+        p_fail = {g: round(float(f.mean()), 4) for g, f in fail.items()}
+        worst = max(p_fail, key=p_fail.get)
+        out.append({
+            "n_samples": n,
+            "seed": int(seed),
+            "p_pass": round(float(1.0 - any_fail.mean()), 4),
+            "p_fail_by_gate": p_fail,
+            "binding_gate": worst if p_fail[worst] > 0 else None,
+            "quantiles_5_50_95": {g: [round(float(v), 3) for v in np.percentile(kpi[g], (5, 50, 95))] for g in kpi},
+        })
+    return out
+
 
 def simplify_candidate(candidate: Dict[str, Any], lang: str = "zh") -> Dict[str, Any]:
     """Compact JSON for humans.
@@ -296,7 +434,7 @@ def simplify_candidate(candidate: Dict[str, Any], lang: str = "zh") -> Dict[str,
     stop = qc.get("fermentation_stop", {}) or {}
     release = qc.get("structure_release", {}) or {}
 
-    return {
+    out = {
         "candidate_id": candidate.get("candidate_id"),
         "deliverable": "process_window_not_recipe",
         "strain_combo_id": candidate.get("strain_combo_id"),
@@ -330,6 +468,10 @@ def simplify_candidate(candidate: Dict[str, Any], lang: str = "zh") -> Dict[str,
         },
         "formulation_table": ingredients,
     }
+    robust = pwin.get("robustness")
+    if robust:
+        out["robustness"] = {"p_pass": robust.get("p_pass"), "binding_gate": robust.get("binding_gate")}
+    return out
 
 
 def _as_float(value: Any, default: float = 0.0) -> float:
@@ -534,28 +676,409 @@ def choose_default_formulation(
     }
 
 
-def generate_candidates(
+def _rank_combos(data: Dict[str, Any], goals: List[str]) -> List[Dict[str, Any]]:
+    return sorted(
+        data.get("strains", []),
+        key=lambda c: sum(2 for g in goals if g in set(c.get("benefit_tags", []))),
+        reverse=True,
+    ) or []
+
+
+def _form_with_dosages(base_form: Dict[str, Any], dosages: Sequence[float]) -> Dict[str, Any]:
+    """Copy of base_form with the protein / sweetener / stabilizer / water dosages replaced."""
+    form = {
+        "base_id": base_form["base_id"],
+        "basis": base_form["basis"],
+        "version": base_form["version"],
+        "role": "formulation_audit_trail_not_core_deliverable",
+        "ingredients": [dict(x) for x in base_form["ingredients"]],
+    }
+    for it, kg in zip(form["ingredients"], dosages):
+        it["dosage_kg"] = round(float(kg), 4)
+    return form
+
+
+def _topk(idx: np.ndarray, key: np.ndarray, k: int):
+    if len(key) <= k:
+        return idx, key
+    part = np.argpartition(-key, k - 1)[:k]
+    return idx[part], key[part]
+
+
+def _front_2d(F: np.ndarray) -> np.ndarray:
+    # rows are unique and lexicographically sorted: a row is dominated iff an
+    # earlier row has a smaller-or-equal second objective
+    best = np.minimum.accumulate(F[:, 1])
+    keep = np.ones(len(F), dtype=bool)
+    keep[1:] = F[1:, 1] < best[:-1]
+    return np.nonzero(keep)[0]
+
+
+def _front_3d(F: np.ndarray) -> np.ndarray:
+    # sweep in lexicographic order over a staircase of (f1, f2): f1 ascending,
+    # f2 strictly descending, so "some earlier row has f1 <= a and f2 <= b" is
+    # one bisect on f1 plus one comparison
+    xs: List[float] = []
+    ys: List[float] = []
+    keep: List[int] = []
+    for i, (a, b) in enumerate(F[:, 1:].tolist()):
+        pos = bisect_right(xs, a)
+        if pos and ys[pos - 1] <= b:
+            continue
+        keep.append(i)
+        lo = pos - 1 if pos and xs[pos - 1] == a else pos
+        end = pos
+        while end < len(xs) and ys[end] >= b:
+            end += 1
+        xs[lo:end] = [a]
+        ys[lo:end] = [b]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def _front_nd(F: np.ndarray, block: int = 512) -> np.ndarray:
+    # block-wise filter for > 3 objectives, rows visited in order of their sum
+    # (a dominator always has a smaller sum). Each block is checked against the
+    # front so far, stopping once no row is left alive, then against itself.
+    order = np.argsort(F.sum(axis=1), kind="stable")
+    front = np.empty((0, F.shape[1]))
+    keep: List[np.ndarray] = []
+    for start in range(0, len(F), block):
+        rows = order[start:start + block]
+        B = F[rows]
+        alive = np.ones(len(B), dtype=bool)
+        for j in range(0, len(front), block):
+            live = np.nonzero(alive)[0]
+            if not len(live):
+                break
+            P = front[j:j + block]
+            alive[live] = ~np.any(np.all(P[None, :, :] <= B[live][:, None, :], axis=2), axis=1)
+        le = np.all(B[None, :, :] <= B[:, None, :], axis=2)  # le[i, j]: row j <= row i
+        np.fill_diagonal(le, False)
+        alive &= ~np.any(le, axis=1)
+        keep.append(rows[alive])
+        front = np.concatenate([front, B[alive]])
+    return np.sort(np.concatenate(keep)) if keep else np.empty(0, dtype=np.int64)
+
+
+def pareto_front(F: np.ndarray) -> np.ndarray:
+    """Indices of the non-dominated rows of F (N, M), every objective minimised.
+
+    Exact duplicates are all kept. O(N log N) for M <= 3 (sort plus sweep);
+    larger M uses a vectorised block filter, O(N * front size) at worst.
+    """
+    F = np.asarray(F, dtype=float)
+    if F.ndim != 2 or not len(F):
+        return np.empty(0, dtype=np.int64)
+    U, inverse = np.unique(F, axis=0, return_inverse=True)  # unique rows, lexicographically sorted
+    inverse = inverse.ravel()
+    if U.shape[1] == 1:
+        on = np.array([0])
+    elif U.shape[1] == 2:
+        on = _front_2d(U)
+    elif U.shape[1] == 3:
+        on = _front_3d(U)
+    else:
+        on = _front_nd(U)
+    mask = np.zeros(len(U), dtype=bool)
+    mask[on] = True
+    return np.nonzero(mask[inverse])[0]
+
+
+# Objectives offered to the Pareto mode (see _objective_matrix for the column
+# minimised for each). The default stays at three so the O(N log N) sweep applies;
+# adding the structure margins makes most of a 4-D dosage grid non-dominated.
+PARETO_OBJECTIVES = ("overall", "syneresis", "yield_stress_margin", "viscosity_margin", "cost")
+DEFAULT_PARETO_OBJECTIVES = ("overall", "syneresis", "cost")
+
+
+def _objective_matrix(ev: Dict[str, np.ndarray], objectives: Sequence[str]) -> np.ndarray:
+    cols = {
+        "overall": lambda: -ev["overall"],
+        "syneresis": lambda: ev["syneresis_pct"],
+        "yield_stress_margin": lambda: -ev["yield_stress_margin"],
+        "viscosity_margin": lambda: -ev["viscosity_margin"],
+        "cost": lambda: ev["cost_per_100kg"],
+    }
+    return np.column_stack([cols[o]() for o in objectives])
+
+
+def search_formulations(
     data: Dict[str, Any],
     req: UserRequest,
     model: Optional[Dict[str, Any]] = None,
-    k: int = 3,
+    k: int = 10,
+    protein_kg: Optional[Sequence[float]] = None,
+    sweetener_kg: Optional[Sequence[float]] = None,
+    stabilizer_kg: Optional[Sequence[float]] = None,
+    combo_ids: Optional[Sequence[str]] = None,
+    end_ph: float = 4.6,
+    ferm_time_h: float = 8.0,
+    chunk_size: int = 1_000_000,
+    prices: Optional[Dict[str, float]] = None,
+    pareto: bool = False,
+    objectives: Sequence[str] = DEFAULT_PARETO_OBJECTIVES,
+) -> Dict[str, Any]:
+    """Score every combo x protein x sweetener x stabilizer grid point and keep the best k.
+
+    The grid is walked in flat chunks of chunk_size points and never held whole:
+    water closes the 100 kg mass balance (points that would need negative water
+    are infeasible), the surrogate is applied via CompiledSurrogate.linear_terms
+    and the physical KPIs via _physical_kpi_arrays, and each chunk's best k are
+    merged with argpartition. The score is overall*10 - syneresis as in
+    generate_candidates (without a model: the smaller relative structure-KPI
+    margin); points that fail the structure KPI rank after every passing one.
+
+    prices (ingredient_id -> price per kg, see storage.ingredient_prices) add
+    cost_per_100kg; unpriced ingredients cost 0 and are listed in "unpriced"
+    (WATER is free). pareto=True returns the whole non-dominated front over
+    `objectives` (names from PARETO_OBJECTIVES; overall / syneresis need a
+    trained model and cost needs at least one priced ingredient, otherwise
+    they are dropped; res["objectives"] holds those used) instead of the top k,
+    ordered by score. Each chunk is reduced to its own front before the final
+    merge, which is exact because a globally non-dominated point is
+    non-dominated within its chunk.
+
+    Returns the grid size, the feasible count and the winners as arrays,
+    best first.
+    """
+    base_form = choose_default_formulation(data, req.base_id, req.texture, req.customer_profile)
+    p = _preset(req.texture)
+    base = [float(it["dosage_kg"]) for it in base_form["ingredients"][:3]]
+    grids = [
+        np.round(np.asarray(g if g is not None else default, dtype=float).ravel(), 4)
+        for g, default in (
+            (protein_kg, np.arange(max(0.0, base[0] - 2.0), base[0] + 2.0001, 0.25)),
+            (sweetener_kg, np.arange(0.2, 1.2001, 0.05)),
+            (stabilizer_kg, np.arange(0.1, 1.0001, 0.025)),
+        )
+    ]
+    if combo_ids is None:
+        combo_ids = [c.get("strain_combo_id") for c in _rank_combos(data, infer_goals(req.brief, req.texture))]
+    combo_ids = list(combo_ids) or ["COMBO-TBD"]
+    shape = (len(combo_ids),) + tuple(len(g) for g in grids)
+    total = int(np.prod(shape))
+
+    trained = bool(model and model.get("ok"))
+    # base_form ingredients are protein, sweetener, stabilizer, WATER
+    ing_ids = [it["ingredient_id"] for it in base_form["ingredients"]]
+    if trained:
+        offsets, coef = CompiledSurrogate(model).linear_terms(combo_ids, ing_ids, end_ph, ferm_time_h)
+    prices = prices or {}
+    unit_price = np.array([float(prices.get(i, 0.0)) for i in ing_ids])
+    unpriced = [i for i in ing_ids if i not in prices and i != "WATER"]
+    objectives = [o for o in objectives if trained or o not in ("overall", "syneresis")]
+    if len(unpriced) == len([i for i in ing_ids if i != "WATER"]):
+        # an all-zero cost column would only add ties to the front
+        objectives = [o for o in objectives if o != "cost"]
+    unknown = set(objectives) - set(PARETO_OBJECTIVES)
+    if unknown:
+        raise ValueError(f"Unknown objective(s): {', '.join(sorted(unknown))}")
+    yield_min = float(p["yield_stress_min_pa"])
+    viscosity_min = float(p["viscosity_min_pa_s"])
+    sy_max = float(p["syneresis_pct_max"])
+
+    def evaluate(idx: np.ndarray) -> Dict[str, np.ndarray]:
+        c, i, j, m = np.unravel_index(idx, shape)
+        D = np.stack([grids[0][i], grids[1][j], grids[2][m]], axis=1)
+        D = np.column_stack([D, np.round(100.0 - D.sum(axis=1), 4)])
+        out: Dict[str, np.ndarray] = {"combo": c, "dosages": D}
+        sy_risk: Any = False
+        if trained:
+            pred = offsets[c] + D @ coef
+            out["syneresis_pct"], out["overall"] = pred[:, 0], pred[:, 1]
+            sy_risk = pred[:, 0] > sy_max
+        ys, visc = _physical_kpi_arrays(p, D[:, 0], D[:, 2], sy_risk)
+        out["yield_stress_Pa"], out["viscosity_Pa_s"] = ys, visc
+        out["yield_stress_margin"] = ys / yield_min - 1.0
+        out["viscosity_margin"] = visc / viscosity_min - 1.0
+        out["pass_structure"] = (ys > yield_min) & (visc > viscosity_min)
+        out["cost_per_100kg"] = D @ unit_price
+        if trained:
+            out["score"] = out["overall"] * 10 - out["syneresis_pct"]
+        else:
+            out["score"] = np.minimum(out["yield_stress_margin"], out["viscosity_margin"])
+        return out
+
+    empty = (np.empty(0, dtype=np.int64), np.empty(0))
+    best = {True: empty, False: empty}
+    front = np.empty(0, dtype=np.int64)
+    n_feasible = 0
+    for start in range(0, total, max(1, int(chunk_size))):
+        idx = np.arange(start, min(total, start + chunk_size), dtype=np.int64)
+        _, i, j, m = np.unravel_index(idx, shape)
+        idx = idx[grids[0][i] + grids[1][j] + grids[2][m] <= 100.0]
+        if not len(idx):
+            continue
+        n_feasible += len(idx)
+        ev = evaluate(idx)
+        if pareto:
+            front = np.concatenate([front, idx[pareto_front(_objective_matrix(ev, objectives))]])
+            continue
+        for passed in (True, False):
+            sel = ev["pass_structure"] == passed
+            prev_idx, prev_key = best[passed]
+            best[passed] = _topk(
+                np.concatenate([prev_idx, idx[sel]]), np.concatenate([prev_key, ev["score"][sel]]), k
+            )
+
+    if pareto:
+        ev = evaluate(front)
+        win = front[pareto_front(_objective_matrix(ev, objectives))]
+        ev = evaluate(win)
+        win = win[np.lexsort((win, -ev["score"]))]
+    else:
+        ranked = []
+        for passed in (True, False):
+            b_idx, b_key = best[passed]
+            ranked.append(b_idx[np.lexsort((b_idx, -b_key))])
+        win = np.concatenate(ranked)[:k]
+    res: Dict[str, Any] = {
+        "base_form": base_form,
+        "n_grid": total,
+        "n_feasible": n_feasible,
+        "unpriced": unpriced,
+    }
+    if pareto:
+        res["objectives"] = list(objectives)
+        res["n_front"] = len(win)
+    ev = evaluate(win)
+    res["strain_combo_id"] = [combo_ids[c] for c in ev.pop("combo")]
+    D = ev.pop("dosages")
+    for col, name in enumerate(("protein_kg", "sweetener_kg", "stabilizer_kg", "water_kg")):
+        res[name] = D[:, col]
+    res.update(ev)
+    return res
+
+
+def propose_doe_batch(
+    data: Dict[str, Any],
+    req: UserRequest,
+    model: Dict[str, Any],
+    q: int = 24,
+    pool_size: int = 5000,
+    acquisition: str = "ei",
+    beta: float = 2.0,
+    best: Optional[float] = None,
+    length_scale: float = 0.15,
+    seed: int = 0,
+    combo_ids: Optional[Sequence[str]] = None,
+    bounds: Optional[Dict[str, Sequence[float]]] = None,
 ) -> List[Dict[str, Any]]:
+    """Propose the next q lab runs by Bayesian optimisation on the surrogate.
+
+    A seeded pool of pool_size random designs is drawn inside `bounds`
+    (protein_kg / sweetener_kg / stabilizer_kg / end_ph / ferm_time_h as
+    (min, max); defaults follow search_formulations and the texture preset),
+    with water closing the 100 kg balance. modeling.propose_batch then picks
+    q of them by EI or UCB on the PosteriorSurrogate of overall*10 - syneresis.
+    Picks are conditioned on in closed form, and picks close to earlier
+    picks are penalised (length_scale is in units of each range). `best` is
+    the best observed score; it defaults to the best predicted score in the pool.
+
+    Returns one run plan per pick: combo, formulation, process settings and
+    the predicted mean / std / acquisition of the score.
+    """
+    if not (model and model.get("ok")):
+        raise ValueError("A trained surrogate is required to propose experiments")
+    post = PosteriorSurrogate(model)
+    base_form = choose_default_formulation(data, req.base_id, req.texture, req.customer_profile)
+    p = _preset(req.texture)
+    base = float(base_form["ingredients"][0]["dosage_kg"])
+    ranges = {
+        "protein_kg": (max(0.0, base - 2.0), base + 2.0),
+        "sweetener_kg": (0.2, 1.2),
+        "stabilizer_kg": (0.1, 1.0),
+        "end_ph": (4.4, 4.7),
+        "ferm_time_h": tuple(p["fermentation_time_h"]),
+    }
+    ranges.update({key: (float(min(v)), float(max(v))) for key, v in (bounds or {}).items()})
+    if combo_ids is None:
+        ranked = [c.get("strain_combo_id") for c in _rank_combos(data, infer_goals(req.brief, req.texture))]
+        combo_ids = list(dict.fromkeys(ranked + list(post.compiled.combo_index)))
+    combo_ids = list(combo_ids) or ["COMBO-TBD"]
+
+    rng = np.random.default_rng(seed)
+    names = ("protein_kg", "sweetener_kg", "stabilizer_kg", "end_ph", "ferm_time_h")
+    lo = np.array([ranges[n][0] for n in names])
+    hi = np.array([ranges[n][1] for n in names])
+    U = rng.random((int(pool_size), len(names)))
+    V = np.round(lo + U * (hi - lo), 3)
+    V = V[V[:, :3].sum(axis=1) <= 100.0]
+    U = (V - lo) / np.where(hi > lo, hi - lo, 1.0)
+    combo = rng.integers(0, len(combo_ids), len(V))
+    D = np.column_stack([V[:, :3], np.round(100.0 - V[:, :3].sum(axis=1), 3)])
+    pool_combos = [combo_ids[c] for c in combo]
+    X = post.compiled.design_matrix(
+        pool_combos, [it["ingredient_id"] for it in base_form["ingredients"]], D, V[:, 3], V[:, 4]
+    )
+    # a different combo counts as far away for the distance penalty
+    Z = np.column_stack([U, 10.0 * np.eye(len(combo_ids))[combo]])
+
+    plans = []
+    for rank, pick in enumerate(propose_batch(
+        post, X, q=q, acquisition=acquisition, beta=beta, best=best, Z=Z, length_scale=length_scale
+    )):
+        i = pick["index"]
+        plans.append({
+            "doe_rank": rank + 1,
+            "strain_combo_id": pool_combos[i],
+            "formulation": _form_with_dosages(base_form, D[i]),
+            "end_ph": float(V[i, 3]),
+            "ferm_time_h": float(V[i, 4]),
+            "predicted_score": pick["mean"],
+            "predicted_score_std": pick["std"],
+            "acquisition": pick["acquisition"],
+        })
+    return plans
+
+
+def score_candidates(
+    data: Dict[str, Any],
+    req: UserRequest,
+    model: Optional[Dict[str, Any]] = None,
+    pool_size: int = 3,
+    kappa: float = 1.0,
+    search: bool = False,
+    search_space: Optional[Dict[str, Any]] = None,
+    found: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """Phase 1 of generate_candidates: lightweight scoring records, best first.
+
+    A record holds only what ranking needs (candidate_id, strain combo,
+    formulation, predictions, physical KPIs, rank_score); process windows and
+    display strings are left to materialise_candidate().
+
+    found is an already computed search_formulations() result for the same
+    request and search_space (e.g. a Pareto front the caller also displays);
+    with search=True it is used instead of running the search again.
+    """
     base_form = choose_default_formulation(data, req.base_id, req.texture, req.customer_profile)
     goals = infer_goals(req.brief, req.texture)
-    structure_kpi = resolve_structure_kpi(req.texture, req.lang)
 
     grid = [(-0.05, 0.0), (0.0, 0.0), (0.05, 0.0), (0.0, -0.05), (0.0, 0.05)]
     random.seed(42)
     random.shuffle(grid)
 
-    combos = sorted(
-        data.get("strains", []),
-        key=lambda c: sum(2 for g in goals if g in set(c.get("benefit_tags", []))),
-        reverse=True,
-    ) or []
-
-    out = []
-    for idx in range(k):
+    combos = _rank_combos(data, goals)
+
+    search_space = dict(search_space or {})
+    end_ph = float(search_space.get("end_ph", 4.6))
+    ferm_time_h = float(search_space.get("ferm_time_h", 8.0))
+
+    forms = []
+    picked = []
+    costs: List[Optional[float]] = []
+    if search:
+        if found is None:
+            found = search_formulations(data, req, model, k=pool_size, **search_space)
+        by_id = {c.get("strain_combo_id"): c for c in data.get("strains", [])}
+        for idx, cid in enumerate(found["strain_combo_id"]):
+            forms.append(_form_with_dosages(found["base_form"], [
+                found[name][idx] for name in ("protein_kg", "sweetener_kg", "stabilizer_kg", "water_kg")
+            ]))
+            picked.append(by_id.get(cid) or {"strain_combo_id": cid})
+            costs.append(float(found["cost_per_100kg"][idx]) if search_space.get("prices") else None)
+    for idx in range(0 if search else pool_size):
         d_s, d_st = grid[idx % len(grid)]
         form = {
             "base_id": base_form["base_id"],
@@ -574,36 +1097,126 @@ def generate_candidates(
             if it["ingredient_id"] == "WATER":
                 it["dosage_kg"] = round(max(0.0, 100.0 - total), 2)
 
-        combo = combos[idx % max(1, len(combos))] if combos else {"strain_combo_id": "COMBO-TBD"}
-        pred = None
-        if model and model.get("ok"):
-            sy, ov = predict(model, combo.get("strain_combo_id", ""), form, end_ph=4.6, ferm_time_h=8.0)
-            pred = {"syneresis_pct": sy, "overall": ov}
-
-        physical_kpis = estimate_physical_kpis(req.texture, form, pred)
-        process_window = build_process_window(
-            texture=req.texture,
-            base_id=req.base_id,
-            formulation=form,
-            physical_kpis=physical_kpis,
-            predicted=pred,
-            model=model,
-        )
+        forms.append(form)
+        picked.append(combos[idx % max(1, len(combos))] if combos else {"strain_combo_id": "COMBO-TBD"})
 
-        candidate = {
+    # score every candidate in one batch
+    preds: List[Optional[Dict[str, float]]] = [None] * len(forms)
+    trained = bool(model and model.get("ok"))
+    if trained and forms:
+        compiled = CompiledSurrogate(model, cache=PREDICTION_CACHE)
+        combo_ids = [c.get("strain_combo_id", "") for c in picked]
+        scores = compiled.predict_many(combo_ids, forms, end_ph=end_ph, ferm_time_h=ferm_time_h)
+        preds = [{"syneresis_pct": float(row[0]), "overall": float(row[1])} for row in scores]
+        if compiled.has_ensemble:
+            iv = compiled.predict_interval(combo_ids, forms, end_ph=end_ph, ferm_time_h=ferm_time_h, level=0.9)
+            member_score = iv["members"][:, :, 1] * 10 - iv["members"][:, :, 0]
+            lcb = member_score.mean(axis=1) - kappa * member_score.std(axis=1)
+            for i, p in enumerate(preds):
+                p["syneresis_pct_pi90"] = [float(iv["lo"][i, 0]), float(iv["hi"][i, 0])]
+                p["overall_pi90"] = [float(iv["lo"][i, 1]), float(iv["hi"][i, 1])]
+                p["score_lcb"] = float(lcb[i])
+
+    records = []
+    for idx, (form, combo, pred) in enumerate(zip(forms, picked, preds)):
+        records.append({
             "candidate_id": f"C{idx+1}",
-            "core_deliverable": "process_window",
-            "strain_combo_id": combo.get("strain_combo_id"),
-            "structure_kpi": structure_kpi,
-            "process_window": process_window,
-            "predicted_physical_kpis": physical_kpis,
+            "strain_combo": combo,
             "formulation": form,
             "predicted": pred,
-            "goals": goals,
-        }
-        candidate["simple_json"] = simplify_candidate(candidate, req.lang)
-        out.append(candidate)
+            "physical_kpis": estimate_physical_kpis(req.texture, form, pred),
+            "rank_score": None if pred is None else pred.get("score_lcb", pred["overall"] * 10 - pred["syneresis_pct"]),
+        })
+        if idx < len(costs) and costs[idx] is not None:
+            records[-1]["cost_per_100kg"] = costs[idx]
+
+    if trained:
+        records.sort(key=lambda r: r["rank_score"], reverse=True)
+    return records
+
+
+def materialise_candidate(
+    record: Dict[str, Any],
+    req: UserRequest,
+    model: Optional[Dict[str, Any]] = None,
+    structure_kpi: Optional[Dict[str, Any]] = None,
+    goals: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """Phase 2 of generate_candidates: the full candidate payload for one scored record."""
+    if structure_kpi is None:
+        structure_kpi = resolve_structure_kpi(req.texture, req.lang)
+    if goals is None:
+        goals = infer_goals(req.brief, req.texture)
+    form, pred, physical_kpis = record["formulation"], record["predicted"], record["physical_kpis"]
+    process_window = build_process_window(
+        texture=req.texture,
+        base_id=req.base_id,
+        formulation=form,
+        physical_kpis=physical_kpis,
+        predicted=pred,
+        model=model,
+    )
+
+    candidate = {
+        "candidate_id": record["candidate_id"],
+        "core_deliverable": "process_window",
+        "strain_combo_id": record["strain_combo"].get("strain_combo_id"),
+        "structure_kpi": structure_kpi,
+        "process_window": process_window,
+        "predicted_physical_kpis": physical_kpis,
+        "formulation": form,
+        "predicted": pred,
+        "goals": goals,
+    }
+    if "cost_per_100kg" in record:
+        candidate["cost_per_100kg"] = round(record["cost_per_100kg"], 2)
+    candidate["simple_json"] = simplify_candidate(candidate, req.lang)
+    return candidate
+
+
+def generate_candidates(
+    data: Dict[str, Any],
+    req: UserRequest,
+    model: Optional[Dict[str, Any]] = None,
+    k: int = 3,
+    kappa: float = 1.0,
+    search: bool = False,
+    search_space: Optional[Dict[str, Any]] = None,
+    pool_size: Optional[int] = None,
+    robustness_samples: int = 0,
+    robustness_seed: int = 0,
+    found: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """Build k candidates and rank them by overall*10 - syneresis.
+
+    With an ensemble model the ranking uses the lower confidence bound of that
+    score over the members (mean - kappa * std), so uncertain candidates rank
+    below equally good but well-supported ones.
+
+    search=True replaces the five demo dosage deltas with search_formulations()
+    over a dosage grid (search_space holds its grid / combo / process keyword
+    arguments); only the k winners are turned into candidates. With
+    search_space={"pareto": True, "prices": ...} the pool is the Pareto front
+    and the k best-scoring front members are returned, with their cost.
+    A search result the caller already holds can be passed as found (see
+    score_candidates) so the grid is not searched twice.
+
+    pool_size (default k) candidates are scored by score_candidates(); only
+    the best k are materialised with process windows and display payloads.
 
-    if model and model.get("ok"):
-        out = sorted(out, key=lambda c: (c["predicted"]["overall"] * 10 - c["predicted"]["syneresis_pct"]), reverse=True)
+    robustness_samples > 0 adds process_window["robustness"] from
+    robustness_scores() (seeded by robustness_seed) for the returned k.
+    """
+    records = score_candidates(
+        data, req, model, pool_size=max(k, pool_size or k), kappa=kappa, search=search,
+        search_space=search_space, found=found,
+    )
+    structure_kpi = resolve_structure_kpi(req.texture, req.lang)
+    goals = infer_goals(req.brief, req.texture)
+    out = [materialise_candidate(r, req, model, structure_kpi, goals) for r in records[:k]]
+    if robustness_samples and out:
+        scores = robustness_scores(out, req.texture, model, n_samples=robustness_samples, seed=robustness_seed)
+        for cand, rob in zip(out, scores):
+            cand["process_window"]["robustness"] = rob
+            cand["simple_json"] = simplify_candidate(cand, req.lang)
     return out
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""Materialised run feature view over the redesigned Admin Database.
+
+One row per runs2 record that has a run_results row, joined once with its
+process, formulation lines, material lots and strain products. Line amounts
+are normalised to kg per 100 kg. Rows use the same shape as legacy runs.jsonl
+records, so core.modeling trains on them directly.
+
+The view is refreshed incrementally: each row remembers the source keys it
+was built from, and only rows depending on a changed record are rebuilt.
+"""
+from __future__ import annotations
+
+import threading
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+try:  # works both in the original package layout and in a flat layout
+    from core import storage
+    from core.modeling import train_surrogate
+except ModuleNotFoundError:  # pragma: no cover - local artifact convenience only
+    import storage
+    from modeling import train_surrogate
+
+
+SOURCE_TABLES: Tuple[str, ...] = (
+    "runs2", "run_results", "processes", "formulation_lines", "material_lots", "strain_products",
+)
+
+# amount unit -> factor to kg per 100 kg product (aqueous bases: 1 L ~ 1 kg)
+UNIT_TO_KG_PER_100KG: Dict[str, float] = {
+    "kg/100kg": 1.0,
+    "kg": 1.0,  # legacy dosage_kg convention: a 100 kg batch
+    "%": 1.0,
+    "%w/w": 1.0,
+    "g/100g": 1.0,
+    "g/100ml": 1.0,
+    "g/kg": 0.1,
+    "g/l": 0.1,
+    "g_per_l": 0.1,
+    "mg/kg": 1e-4,
+    "mg/l": 1e-4,
+    "ppm": 1e-4,
+}
+
+RESULT_TARGETS: Tuple[str, ...] = ("syneresis_pct", "tauy_Pa", "Gp_1Hz_Pa", "recovery_pct")
+
+
+def to_kg_per_100kg(value: Any, unit: Optional[str]) -> Optional[float]:
+    """Convert a line amount to kg per 100 kg; None for missing/unknown units or non-numbers."""
+    if unit is None or not str(unit).strip():
+        return None
+    factor = UNIT_TO_KG_PER_100KG.get(str(unit).replace(" ", "").lower())
+    try:
+        return None if factor is None else float(value) * factor
+    except (TypeError, ValueError):
+        return None
+
+
+def _num(v: Any) -> Optional[float]:
+    try:
+        return None if v is None or v == "" else float(v)
+    except (TypeError, ValueError):
+        return None
+
+
+class RunFeatureView:
+    """Joined, unit-normalised run rows kept in memory and refreshed incrementally."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.signatures: Dict[str, Any] = {}
+        self.tables: Dict[str, Dict[str, Dict[str, Any]]] = {t: {} for t in SOURCE_TABLES}
+        self.rows: Dict[str, Dict[str, Any]] = {}
+        # (source, key) -> run_ids whose row was built from it
+        self.deps: Dict[Tuple[str, str], Set[str]] = {}
+        self.run_deps: Dict[str, Set[Tuple[str, str]]] = {}
+
+    # -- change detection -------------------------------------------------
+
+    def _changed_keys(self, table: str, new: Dict[str, Dict[str, Any]]) -> Set[Tuple[str, str]]:
+        old = self.tables[table]
+        keys: Set[Tuple[str, str]] = set()
+        for pk in set(old) | set(new):
+            a, b = old.get(pk), new.get(pk)
+            if a is b or (a is not None and b is not None and a == b):
+                continue
+            if table == "formulation_lines":
+                # a line affects every run of the formulation it left or joined
+                for rec in (a, b):
+                    if rec is not None and rec.get("formulation_id"):
+                        keys.add(("lines_of", str(rec["formulation_id"])))
+            else:
+                keys.add((table, pk))
+        return keys
+
+    def refresh(self) -> List[Dict[str, Any]]:
+        """Bring the view up to date and return its rows (run_id order of runs2)."""
+        with self.lock:
+            sigs = {t: storage.admin_table_signature(t) for t in SOURCE_TABLES}
+            stale = [t for t in SOURCE_TABLES if sigs[t] != self.signatures.get(t)]
+            if stale:
+                loaded = storage.load_admin_db(tables=stale)
+                changed: Set[Tuple[str, str]] = set()
+                for t in stale:
+                    id_key = storage.get_admin_paths()[t][1]
+                    new = {str(r.get(id_key)): r for r in loaded[t] if r.get(id_key) is not None}
+                    changed |= self._changed_keys(t, new)
+                    self.tables[t] = new
+                self.signatures = sigs
+                affected: Set[str] = set()
+                for key in changed:
+                    affected |= self.deps.get(key, set())
+                    if key[0] in ("runs2", "run_results"):
+                        affected.add(key[1])
+                for run_id in affected:
+                    self._rebuild(run_id)
+            runs = self.tables["runs2"]
+            return [self.rows[r] for r in runs if r in self.rows]
+
+    # -- row construction -------------------------------------------------
+
+    def _set_deps(self, run_id: str, deps: Set[Tuple[str, str]]) -> None:
+        for key in self.run_deps.pop(run_id, set()):
+            bucket = self.deps.get(key)
+            if bucket is not None:
+                bucket.discard(run_id)
+                if not bucket:
+                    del self.deps[key]
+        if deps:
+            self.run_deps[run_id] = deps
+            for key in deps:
+                self.deps.setdefault(key, set()).add(run_id)
+
+    def _rebuild(self, run_id: str) -> None:
+        run = self.tables["runs2"].get(run_id)
+        res = self.tables["run_results"].get(run_id)
+        if run is None or res is None:
+            self.rows.pop(run_id, None)
+            self._set_deps(run_id, set())
+            return
+        fid = str(run.get("formulation_id") or "")
+        pid = str(run.get("process_id") or "")
+        deps: Set[Tuple[str, str]] = {("runs2", run_id), ("run_results", run_id), ("lines_of", fid), ("processes", pid)}
+        lots = self.tables["material_lots"]
+        proc = self.tables["processes"].get(pid) or {}
+
+        strains: Set[str] = set()
+        if run.get("starter_id"):
+            strains.add(str(run["starter_id"]))
+        dosages: Dict[str, float] = {}
+        unit_issues: List[str] = []
+        for line in storage.lines_for_formulation(fid) if fid else []:
+            lot_id = str(line.get("lot_id") or "")
+            if lot_id:
+                deps.add(("material_lots", lot_id))
+            lot = lots.get(lot_id) or {}
+            if line.get("role") == "strain" or line.get("strain_product_id"):
+                spid = line.get("strain_product_id") or lot.get("strain_product_id")
+                if spid:
+                    strains.add(str(spid))
+                continue
+            mid = line.get("material_id") or lot.get("material_id")
+            if not mid:
+                continue
+            kg = to_kg_per_100kg(line.get("amount_value"), line.get("amount_unit"))
+            if kg is None:
+                unit_issues.append(f"{line.get('line_id')}: {line.get('amount_value')!r} {line.get('amount_unit')!r}")
+                continue
+            dosages[str(mid)] = dosages.get(str(mid), 0.0) + kg
+        for spid in strains:
+            deps.add(("strain_products", spid))
+        sp = self.tables["strain_products"]
+
+        self.rows[run_id] = {
+            "run_id": run_id,
+            "formulation_id": fid,
+            "process_id": pid,
+            "strain_combo_id": "+".join(sorted(strains)),
+            "strain_product_names": [sp.get(s, {}).get("product_name") for s in sorted(strains)],
+            "formulation": {
+                "basis": "kg_per_100kg",
+                "ingredients": [{"ingredient_id": k, "dosage_kg": round(v, 6)} for k, v in sorted(dosages.items())],
+            },
+            "end_ph": _num(res.get("pH_end")),
+            "fermentation_time_h": _num(proc.get("fermentation_time_h")),
+            "fermentation_temp_C": _num(proc.get("fermentation_temp_C")),
+            "rheology": {k: _num(res.get(k)) for k in RESULT_TARGETS},
+            "sensory": {"overall": _num(res.get("overall"))},
+            "quality_flags": {"qc_flag": res.get("qc_flag")},
+            "unit_issues": unit_issues,
+        }
+        self._set_deps(run_id, deps)
+
+
+_VIEW: Optional[RunFeatureView] = None
+_VIEW_LOCK = threading.Lock()
+
+
+def run_feature_view() -> List[Dict[str, Any]]:
+    """Current rows of the process-wide run feature view (refreshed on each call)."""
+    global _VIEW
+    with _VIEW_LOCK:
+        if _VIEW is None:
+            _VIEW = RunFeatureView()
+        view = _VIEW
+    return view.refresh()
+
+
+def train_surrogate_from_view(
+    alpha: Any = 1.0,
+    qc_pass_only: bool = True,
+    extra_targets: Tuple[str, ...] = (),
+    keep_stats: bool = False,
+) -> Dict[str, Any]:
+    """Fit the surrogate on the admin DB feature view.
+
+    Rows need pH_end and a process fermentation time; with qc_pass_only, results
+    flagged "suspect" or "fail" are left out (a missing flag counts as pass).
+    Feature ids are admin material / strain product ids, so store the model under
+    its own model_type rather than the engine's surrogate_v1.
+    """
+    rows = [
+        r for r in run_feature_view()
+        if r["end_ph"] is not None and r["fermentation_time_h"] is not None
+        and (not qc_pass_only or r["quality_flags"].get("qc_flag") in (None, "", "pass"))
+    ]
+    model = train_surrogate(rows, alpha=alpha, gate_full=False, extra_targets=extra_targets, keep_stats=keep_stats)
+    model["source"] = "admin_run_feature_view"
+    model["qc_pass_only"] = qc_pass_only
+    return model
@@ -1,6 +1,17 @@
 from __future__ import annotations
 
-from typing import Dict, Any, List, Tuple
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from statistics import NormalDist
+from typing import Dict, Any, List, Optional, Sequence, Tuple, Union
+import hashlib
+import json
+import math
+import os
+import struct
+import threading
+import zipfile
 import numpy as np
 
 
@@ -8,10 +19,131 @@ def _one_hot_index(values: List[str]) -> Dict[str, int]:
     return {v: i for i, v in enumerate(sorted(set(values)))}
 
 
+class SparseMatrix:
+    """Minimal CSR matrix in NumPy alone, enough for ridge on the training design.
+
+    Rows are runs; each holds one combo flag, a handful of ingredient dosages and
+    the two process columns, so X is mostly zeros once the one-hot schema grows.
+    """
+
+    def __init__(self, rows: np.ndarray, cols: np.ndarray, vals: np.ndarray, shape: Tuple[int, int]):
+        # entries must be unique per (row, col) and sorted row-major (see from_coo)
+        self.rows = rows
+        self.indices = cols
+        self.data = vals
+        self.shape = shape
+        self.indptr = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=shape[0]))))
+
+    @classmethod
+    def from_coo(cls, rows, cols, vals, shape: Tuple[int, int]) -> "SparseMatrix":
+        """Build from triplets; a repeated (row, col) keeps its last value, as dense assignment would."""
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        vals = np.asarray(vals, dtype=float)
+        key = rows * shape[1] + cols
+        _, first = np.unique(key[::-1], return_index=True)
+        keep = len(key) - 1 - first  # sorted by key, i.e. row-major
+        return cls(rows[keep], cols[keep], vals[keep], shape)
+
+    def scale_rows(self, f: np.ndarray) -> "SparseMatrix":
+        """diag(f) @ X (used for bootstrap / fold weights)."""
+        return SparseMatrix(self.rows, self.indices, self.data * np.asarray(f, dtype=float)[self.rows], self.shape)
+
+    def toarray(self) -> np.ndarray:
+        out = np.zeros(self.shape, dtype=float)
+        out[self.rows, self.indices] = self.data
+        return out
+
+    def row_block(self, a: int, b: int) -> np.ndarray:
+        """Dense copy of rows a:b."""
+        lo, hi = self.indptr[a], self.indptr[min(b, self.shape[0])]
+        out = np.zeros((min(b, self.shape[0]) - a, self.shape[1]), dtype=float)
+        out[self.rows[lo:hi] - a, self.indices[lo:hi]] = self.data[lo:hi]
+        return out
+
+    def __matmul__(self, w: np.ndarray) -> np.ndarray:
+        w = np.asarray(w, dtype=float)
+        if w.ndim == 1:
+            return np.bincount(self.rows, weights=self.data * w[self.indices], minlength=self.shape[0])
+        # wide right-hand sides: densify row blocks and let BLAS do the work
+        step = 8192
+        return np.vstack([self.row_block(a, a + step) @ w for a in range(0, self.shape[0], step)]) \
+            if self.shape[0] else np.zeros((0, w.shape[1]))
+
+    def rmatvec(self, y: np.ndarray) -> np.ndarray:
+        """X^T y."""
+        y = np.asarray(y, dtype=float)
+        if y.ndim == 1:
+            return np.bincount(self.indices, weights=self.data * y[self.rows], minlength=self.shape[1])
+        return np.stack([self.rmatvec(y[:, j]) for j in range(y.shape[1])], axis=1)
+
+    def gram(self, chunk_rows: int = 16384) -> np.ndarray:
+        """X^T X accumulated from per-row outer products of the non-zeros (padded to the widest row)."""
+        n, p = self.shape
+        nnz = np.diff(self.indptr)
+        width = int(nnz.max()) if n else 0
+        G = np.zeros(p * p, dtype=float)
+        if width == 0:
+            return G.reshape(p, p)
+        pos = np.arange(len(self.rows)) - self.indptr[self.rows]
+        ell_cols = np.zeros((n, width), dtype=np.int64)
+        ell_vals = np.zeros((n, width), dtype=float)
+        ell_cols[self.rows, pos] = self.indices
+        ell_vals[self.rows, pos] = self.data
+        for a in range(0, n, chunk_rows):
+            c = ell_cols[a: a + chunk_rows]
+            v = ell_vals[a: a + chunk_rows]
+            keys = (c[:, :, None] * p + c[:, None, :]).ravel()
+            G += np.bincount(keys, weights=(v[:, :, None] * v[:, None, :]).ravel(), minlength=p * p)
+        return G.reshape(p, p)
+
+
+# Optional extra regression targets (run_results / rheology fields) for train_surrogate.
+EXTRA_TARGETS: Tuple[str, ...] = ("tauy_Pa", "Gp_1Hz_Pa", "recovery_pct")
+
+
+def _extra_target(r: Dict[str, Any], name: str):
+    v = (r.get("rheology") or {}).get(name)
+    return r.get(name) if v is None else v
+
+
 def build_training_matrix(
-    runs: List[Dict[str, Any]], gate_full: bool = True
-) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Dict[str, Any]]:
-    usable = []
+    runs: List[Dict[str, Any]], gate_full: bool = True, sparse: bool = False
+):
+    """Design matrix X, targets (syneresis, overall) and schema from gated runs.
+
+    One pass collects the features column-wise (combo ids, ingredient triplets,
+    end pH, fermentation time); ids are indexed with np.unique and X is assembled
+    from COO triplets. sparse=True returns X as a SparseMatrix instead of a
+    dense array; the schema is the same either way.
+    """
+    X, Y, schema = build_training_data(runs, gate_full=gate_full, sparse=sparse)
+    return X, Y.get("syneresis", np.zeros((0,))), Y.get("overall", np.zeros((0,))), schema
+
+
+def build_training_data(
+    runs: List[Dict[str, Any]],
+    gate_full: bool = True,
+    sparse: bool = False,
+    extra_targets: Tuple[str, ...] = (),
+    min_runs: int = 8,
+):
+    """Like build_training_matrix, with targets returned as {name: y}.
+
+    extra_targets (e.g. EXTRA_TARGETS) are read from the run's rheology block or
+    top level; when requested, runs missing any of them are left out so every
+    target shares one design matrix. min_runs lowers the "too_few_runs" floor
+    for incremental batches.
+    """
+    extras: Dict[str, List[float]] = {name: [] for name in extra_targets}
+    combo_ids: List[str] = []
+    trip_rows: List[int] = []
+    trip_ids: List[str] = []
+    trip_vals: List[float] = []
+    end_ph: List[float] = []
+    ferm_h: List[float] = []
+    y_sy: List[float] = []
+    y_ov: List[float] = []
     for r in runs:
         rheo = r.get("rheology", {}) or {}
         q = r.get("quality_flags", {}) or {}
@@ -24,77 +156,402 @@ def build_training_matrix(
         ov = (r.get("sensory", {}) or {}).get("overall")
         if sy is None or ov is None:
             continue
-        if (r.get("formulation") or {}).get("ingredients") is None:
+        ingredients = (r.get("formulation") or {}).get("ingredients")
+        if ingredients is None:
             continue
-        usable.append(r)
-
-    if len(usable) < 8:
-        return np.zeros((0, 1)), np.zeros((0,)), np.zeros((0,)), {"n_used": len(usable), "reason": "too_few_runs"}
-
-    combo_ids = [r.get("strain_combo_id", "") for r in usable]
-    combo_index = _one_hot_index(combo_ids)
-
-    ing_ids = []
-    for r in usable:
-        for it in (r.get("formulation") or {}).get("ingredients", []):
+        extra_vals = [_extra_target(r, name) for name in extra_targets]
+        if any(v is None for v in extra_vals):
+            continue
+        for name, v in zip(extra_targets, extra_vals):
+            extras[name].append(float(v))
+        i = len(combo_ids)
+        combo_ids.append(r.get("strain_combo_id", ""))
+        for it in ingredients:
             iid = it.get("ingredient_id")
             if iid and iid != "WATER":
-                ing_ids.append(iid)
-    ing_index = _one_hot_index(ing_ids) if ing_ids else {}
-
-    n = len(usable)
-    p = len(combo_index) + len(ing_index) + 2  # end_ph, ferm_time
-    X = np.zeros((n, p), dtype=float)
-    y_sy = np.zeros((n,), dtype=float)
-    y_ov = np.zeros((n,), dtype=float)
-
-    for i, r in enumerate(usable):
-        c = r.get("strain_combo_id", "")
-        if c in combo_index:
-            X[i, combo_index[c]] = 1.0
-
-        offset = len(combo_index)
-        for it in (r.get("formulation") or {}).get("ingredients", []):
-            iid = it.get("ingredient_id")
-            if not iid or iid == "WATER":
-                continue
-            j = ing_index.get(iid)
-            if j is not None:
-                X[i, offset + j] = float(it.get("dosage_kg", 0.0))
+                trip_rows.append(i)
+                trip_ids.append(iid)
+                trip_vals.append(float(it.get("dosage_kg", 0.0)))
+        end_ph.append(float(r.get("end_ph", 0.0)))
+        ferm_h.append(float(r.get("fermentation_time_h", 0.0)))
+        y_sy.append(float(sy))
+        y_ov.append(float(ov))
 
-        X[i, offset + len(ing_index) + 0] = float(r.get("end_ph", 0.0))
-        X[i, offset + len(ing_index) + 1] = float(r.get("fermentation_time_h", 0.0))
+    n = len(combo_ids)
+    if n < max(min_runs, 1):
+        empty = {name: np.zeros((0,)) for name in ["syneresis", "overall", *extra_targets]}
+        return np.zeros((0, 1)), empty, {"n_used": n, "reason": "too_few_runs"}
 
-        y_sy[i] = float((r.get("rheology") or {}).get("syneresis_pct"))
-        y_ov[i] = float((r.get("sensory") or {}).get("overall"))
+    combo_keys, combo_col = np.unique(np.asarray(combo_ids, dtype=str), return_inverse=True)
+    if trip_ids:
+        ing_keys, ing_col = np.unique(np.asarray(trip_ids, dtype=str), return_inverse=True)
+    else:
+        ing_keys, ing_col = np.zeros((0,), dtype=str), np.zeros((0,), dtype=np.int64)
+    combo_index = {str(v): i for i, v in enumerate(combo_keys)}
+    ing_index = {str(v): i for i, v in enumerate(ing_keys)}
 
+    n_c, n_i = len(combo_index), len(ing_index)
+    p = n_c + n_i + 2  # end_ph, ferm_time
+    ar = np.arange(n)
+    X = SparseMatrix.from_coo(
+        np.concatenate([ar, np.asarray(trip_rows, dtype=np.int64), ar, ar]),
+        np.concatenate([combo_col, n_c + ing_col, np.full(n, p - 2), np.full(n, p - 1)]),
+        np.concatenate([np.ones(n), np.asarray(trip_vals, dtype=float), end_ph, ferm_h]),
+        (n, p),
+    )
     schema = {"combo_index": combo_index, "ingredient_index": ing_index, "n_used": n}
-    return X, y_sy, y_ov, schema
+    Y = {"syneresis": np.asarray(y_sy), "overall": np.asarray(y_ov)}
+    Y.update({name: np.asarray(v) for name, v in extras.items()})
+    return (X if sparse else X.toarray()), Y, schema
+
+
+def ridge_fit(X, y: np.ndarray, alpha: float = 1.0):
+    """Ridge without intercept; X may be dense or a SparseMatrix (X^T X accumulated sparsely)."""
+    W, rmse = ridge_fit_multi(X, np.asarray(y, dtype=float)[:, None], alpha=alpha)
+    return W[:, 0], float(rmse[0])
+
+
+class RidgeSolver:
+    """X^T X factorised once (eigendecomposition) and shared by every target and alpha.
+
+    With X^T X = V diag(lam) V^T, the ridge solution for any alpha is
+    V diag(1 / (lam + alpha)) V^T X^T Y: after the O(p^3) factorisation each
+    extra target column or alpha value costs only O(p^2).
+    A solver built from_stats (no X rows) still gives weights, training RMSE
+    and GCV, all from X^T X, X^T Y, sum(Y**2), sum(Y) and n.
+    """
+
+    def __init__(self, X, Y: np.ndarray):
+        Y = np.asarray(Y, dtype=float)
+        if Y.ndim == 1:
+            Y = Y[:, None]
+        if isinstance(X, SparseMatrix):
+            XtX, XtY = X.gram(), X.rmatvec(Y)
+        else:
+            X = np.asarray(X, dtype=float)
+            XtX, XtY = X.T @ X, X.T @ Y
+        self.X = X
+        self.Y = Y
+        self._factorise(XtX, XtY, np.sum(Y ** 2, axis=0), np.sum(Y, axis=0), Y.shape[0])
+
+    @classmethod
+    def from_stats(
+        cls, XtX: np.ndarray, XtY: np.ndarray, YtY: np.ndarray, Ysum: np.ndarray, n: int
+    ) -> "RidgeSolver":
+        solver = cls.__new__(cls)
+        solver.X = None
+        solver.Y = None
+        solver._factorise(*(np.asarray(a, dtype=float) for a in (XtX, XtY, YtY, Ysum)), n)
+        return solver
+
+    def _factorise(self, XtX: np.ndarray, XtY: np.ndarray, YtY: np.ndarray, Ysum: np.ndarray, n: int) -> None:
+        self.XtX, self.XtY, self.YtY, self.Ysum, self.n = XtX, XtY, YtY, Ysum, int(n)
+        self.lam, self.V = np.linalg.eigh(XtX)
+        self.lam = np.clip(self.lam, 0.0, None)  # X^T X is PSD; drop rounding negatives
+        self.VtXtY = self.V.T @ XtY
+
+    def coef(self, alpha: float) -> np.ndarray:
+        """Weights (p, n_targets) for one alpha."""
+        return self.V @ (self.VtXtY / (self.lam + alpha)[:, None])
 
+    def _rss(self, alpha: float) -> np.ndarray:
+        # ||Y - X W||^2 per target, in the eigenbasis: no X rows needed
+        inv = 1.0 / (self.lam + alpha)
+        b2 = self.VtXtY ** 2
+        rss = self.YtY - 2.0 * (inv @ b2) + (self.lam * inv ** 2) @ b2
+        return np.clip(rss, 0.0, None)
 
-def ridge_fit(X: np.ndarray, y: np.ndarray, alpha: float = 1.0):
-    p = X.shape[1]
-    w = np.linalg.solve(X.T @ X + alpha * np.eye(p), X.T @ y)
-    rmse = float(np.sqrt(np.mean((y - X @ w) ** 2)))
-    return w, rmse
+    def rmse(self, W: np.ndarray, alpha: Optional[float] = None) -> np.ndarray:
+        if self.X is None:
+            return np.sqrt(self._rss(alpha) / max(self.n, 1))
+        return np.sqrt(np.mean((self.Y - self.X @ W) ** 2, axis=0))
 
+    def cv_curve(self, alphas: Sequence[float], method: str = "loo") -> np.ndarray:
+        """Closed-form CV RMSE per (alpha, target) without refitting.
 
-def train_surrogate(runs: List[Dict[str, Any]], alpha: float = 1.0, gate_full: bool = True) -> Dict[str, Any]:
-    X, y_sy, y_ov, schema = build_training_matrix(runs, gate_full=gate_full)
+        With Z = X V, fitted values are Z diag(1/(lam+alpha)) V^T X^T Y and the
+        hat-matrix diagonal is (Z**2) @ (1/(lam+alpha)), so each alpha costs a
+        few O(n p) products. "loo" uses the exact leave-one-out residual
+        e_i / (1 - h_ii); "gcv" replaces h_ii by its mean trace(H) / n and, being
+        a function of the RSS alone, also works on a from_stats solver.
+        """
+        if method not in ("loo", "gcv"):
+            raise ValueError(f"Unknown CV method: {method}")
+        n = self.n
+        out = np.zeros((len(alphas), self.VtXtY.shape[1]))
+        if method == "gcv":
+            for a, alpha in enumerate(alphas):
+                denom = max(1.0 - float(np.sum(self.lam / (self.lam + alpha))) / n, 1e-12)
+                out[a] = np.sqrt(self._rss(alpha) / n) / denom
+            return out
+        if self.X is None:
+            raise ValueError("Leave-one-out CV needs the training rows; use method='gcv'")
+        Z = self.X @ self.V
+        Z2 = Z ** 2
+        for a, alpha in enumerate(alphas):
+            inv = 1.0 / (self.lam + alpha)
+            resid = self.Y - Z @ (self.VtXtY * inv[:, None])
+            denom = np.clip(1.0 - Z2 @ inv, 1e-12, None)[:, None]
+            out[a] = np.sqrt(np.mean((resid / denom) ** 2, axis=0))
+        return out
+
+
+# Default alpha grid for automatic selection.
+ALPHA_GRID: Tuple[float, ...] = tuple(float(a) for a in np.logspace(-3, 3, 25))
+
+
+def select_alpha(
+    solver: RidgeSolver, alphas: Optional[Sequence[float]] = None, method: str = "loo"
+) -> Tuple[float, np.ndarray]:
+    """Alpha minimising the CV RMSE, shared by all targets.
+
+    Targets are put on one scale by dividing each CV curve by that target's
+    standard deviation before averaging. Returns (alpha, curve of shape
+    (n_alphas, n_targets)).
+    """
+    alphas = list(alphas or ALPHA_GRID)
+    curve = solver.cv_curve(alphas, method=method)
+    n = max(solver.n, 1)
+    scale = np.sqrt(np.clip(solver.YtY / n - (solver.Ysum / n) ** 2, 0.0, None))
+    score = np.mean(curve / np.where(scale > 0, scale, 1.0), axis=1)
+    return float(alphas[int(np.argmin(score))]), curve
+
+
+def ridge_fit_multi(X, Y: np.ndarray, alpha: float = 1.0):
+    """Multi-output ridge: one factorisation, all target columns solved together.
+
+    Returns (W of shape (p, n_targets), per-target training RMSE array).
+    """
+    solver = RidgeSolver(X, Y)
+    W = solver.coef(alpha)
+    return W, solver.rmse(W)
+
+
+def train_surrogate(
+    runs: List[Dict[str, Any]],
+    alpha: Union[float, str] = 1.0,
+    gate_full: bool = True,
+    extra_targets: Tuple[str, ...] = (),
+    alphas: Optional[Sequence[float]] = None,
+    cv: str = "loo",
+    keep_stats: bool = False,
+    ensemble: int = 0,
+    ensemble_method: str = "bootstrap",
+    ensemble_executor: str = "process",
+    seed: int = 42,
+) -> Dict[str, Any]:
+    """Fit syneresis + overall (plus any extra_targets) with one shared factorisation.
+
+    Each target t is stored as weights_<t> / rmse_<t>; CompiledSurrogate picks
+    all of them up. alpha="auto" picks alpha from `alphas` (default ALPHA_GRID)
+    by closed-form CV (`cv`: "loo" or "gcv") and records the chosen value, the
+    grid, the CV curve per target (cv_rmse_<t>) and the CV error at the chosen
+    alpha (cv_rmse_at_alpha_<t>). keep_stats=True also returns the sufficient
+    statistics (stats_*) that update_surrogate() extends later.
+    ensemble=B > 1 additionally fits B members (see fit_ensemble) at the chosen
+    alpha and stores them as ensemble_weights (B, p, n_targets); the point
+    weights stay the full-data fit.
+    """
+    X, Y, schema = build_training_data(runs, gate_full=gate_full, sparse=True, extra_targets=tuple(extra_targets))
     if X.shape[0] == 0:
         return {"ok": False, "schema": schema}
-    w_sy, rmse_sy = ridge_fit(X, y_sy, alpha=alpha)
-    w_ov, rmse_ov = ridge_fit(X, y_ov, alpha=alpha)
-    return {
+    names = list(Y)
+    Ymat = np.stack([Y[t] for t in names], axis=1)
+    solver = RidgeSolver(X, Ymat)
+    model = _model_from_solver(solver, schema, names, alpha, gate_full, alphas, cv, keep_stats)
+    if ensemble and ensemble > 1:
+        model["ensemble_weights"] = fit_ensemble(
+            X, Ymat, model["alpha"], n_models=ensemble, method=ensemble_method,
+            seed=seed, executor=ensemble_executor,
+        )
+        model["ensemble_method"] = ensemble_method
+        model["ensemble_size"] = int(ensemble)
+    return model
+
+
+# -----------------------------
+# Ensembles (bootstrap / k-fold)
+# -----------------------------
+
+_ENSEMBLE_STATE: Dict[str, Any] = {}
+
+
+def _ensemble_init(rows, cols, vals, shape, Y, alpha) -> None:
+    # process-pool initializer: the design is shipped once per worker, not per member
+    _ENSEMBLE_STATE.update(X=SparseMatrix(rows, cols, vals, shape), Y=Y, alpha=alpha)
+
+
+def _ensemble_member(task: Tuple[str, int, int, int], state: Optional[Dict[str, Any]] = None) -> np.ndarray:
+    method, member, n_models, seed = task
+    st = state if state is not None else _ENSEMBLE_STATE
+    X, Y = st["X"], st["Y"]
+    n = X.shape[0]
+    if method == "bootstrap":
+        w = np.bincount(np.random.default_rng([seed, member]).integers(0, n, n), minlength=n).astype(float)
+    else:  # k-fold: member k leaves out fold k of one seeded permutation
+        w = np.ones(n)
+        w[np.random.default_rng(seed).permutation(n)[member::n_models]] = 0.0
+    root = np.sqrt(w)
+    return RidgeSolver(X.scale_rows(root), Y * root[:, None]).coef(st["alpha"])
+
+
+def fit_ensemble(
+    X,
+    Y: np.ndarray,
+    alpha: float,
+    n_models: int = 16,
+    method: str = "bootstrap",
+    seed: int = 42,
+    executor: str = "process",
+    max_workers: Optional[int] = None,
+) -> np.ndarray:
+    """Fit n_models ridge members and return their weights stacked as (B, p, n_targets).
+
+    method="bootstrap" resamples rows with replacement (as row weights);
+    method="kfold" leaves one of n_models folds out per member. Members are
+    seeded, so results do not depend on the executor. executor="process"
+    spreads members over a process pool; "serial" fits them here.
+    """
+    if method not in ("bootstrap", "kfold"):
+        raise ValueError(f"Unknown ensemble method: {method}")
+    if not isinstance(X, SparseMatrix):
+        Xd = np.asarray(X, dtype=float)
+        r, c = np.nonzero(Xd)
+        X = SparseMatrix(r, c, Xd[r, c], Xd.shape)
+    Y = np.asarray(Y, dtype=float)
+    if Y.ndim == 1:
+        Y = Y[:, None]
+    tasks = [(method, b, n_models, seed) for b in range(n_models)]
+    workers = min(n_models, max_workers or os.cpu_count() or 1)
+    if executor == "serial" or workers <= 1:
+        state = {"X": X, "Y": Y, "alpha": float(alpha)}
+        members = [_ensemble_member(t, state) for t in tasks]
+    elif executor == "process":
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_ensemble_init,
+            initargs=(X.rows, X.indices, X.data, X.shape, Y, float(alpha)),
+        ) as pool:
+            members = list(pool.map(_ensemble_member, tasks))
+    else:
+        raise ValueError(f"Unknown executor: {executor}")
+    return np.stack(members, axis=0)
+
+
+def _model_from_solver(
+    solver: RidgeSolver,
+    schema: Dict[str, Any],
+    names: List[str],
+    alpha: Union[float, str],
+    gate_full: bool,
+    alphas: Optional[Sequence[float]],
+    cv: str,
+    keep_stats: bool,
+) -> Dict[str, Any]:
+    cv_info: Dict[str, Any] = {}
+    if alpha == "auto":
+        grid = list(alphas or ALPHA_GRID)
+        alpha, curve = select_alpha(solver, grid, method=cv)
+        best = grid.index(alpha)
+        cv_info = {"alpha_mode": "auto", "cv_method": cv, "cv_alphas": grid}
+        for j, t in enumerate(names):
+            cv_info[f"cv_rmse_{t}"] = curve[:, j].tolist()
+            cv_info[f"cv_rmse_at_alpha_{t}"] = float(curve[best, j])
+    alpha = float(alpha)
+    W = solver.coef(alpha)
+    rmse = solver.rmse(W, alpha)
+    model: Dict[str, Any] = {
         "ok": True,
         "schema": schema,
         "alpha": alpha,
         "gate_full": gate_full,
-        "weights_syneresis": w_sy.tolist(),
-        "weights_overall": w_ov.tolist(),
-        "rmse_syneresis": rmse_sy,
-        "rmse_overall": rmse_ov,
+        "targets": names,
     }
+    model.update(cv_info)
+    for j, t in enumerate(names):
+        model[f"weights_{t}"] = W[:, j].tolist()
+    for j, t in enumerate(names):
+        model[f"rmse_{t}"] = float(rmse[j])
+    if keep_stats:
+        model.update({
+            "stats_xtx": solver.XtX,
+            "stats_xty": solver.XtY,
+            "stats_yty": solver.YtY,
+            "stats_ysum": solver.Ysum,
+        })
+    return model
+
+
+def has_stats(model: Optional[Dict[str, Any]]) -> bool:
+    return bool(model) and all(model.get(k) is not None for k in ("stats_xtx", "stats_xty", "stats_yty", "stats_ysum"))
+
+
+def update_surrogate(
+    model: Dict[str, Any],
+    new_runs: List[Dict[str, Any]],
+    alpha: Union[float, str, None] = None,
+    alphas: Optional[Sequence[float]] = None,
+) -> Dict[str, Any]:
+    """Refit a keep_stats model after adding only `new_runs` to its sufficient statistics.
+
+    X^T X, X^T Y, sum(Y**2), sum(Y) and n are extended with the new batch
+    (O(new runs * p)) and re-solved (O(p^3)); history is never replayed.
+    Combo / ingredient ids not in the schema get new columns appended to their
+    block, so existing entries keep their positions. alpha=None reuses the
+    model's alpha; "auto" selects it by GCV (LOO needs the full rows).
+    """
+    if not has_stats(model):
+        raise ValueError("Model has no sufficient statistics; train it with keep_stats=True")
+    names = list(model.get("targets") or ["syneresis", "overall"])
+    gate_full = bool(model.get("gate_full", True))
+    old_combo = dict(model["schema"]["combo_index"])
+    old_ing = dict(model["schema"]["ingredient_index"])
+    XtX = np.asarray(model["stats_xtx"], dtype=float)
+    XtY = np.asarray(model["stats_xty"], dtype=float)
+    YtY = np.array(model["stats_yty"], dtype=float)
+    Ysum = np.array(model["stats_ysum"], dtype=float)
+    n = int(model["schema"].get("n_used", 0))
+
+    Xb, Yb, sb = build_training_data(new_runs, gate_full=gate_full, sparse=True, extra_targets=tuple(names[2:]), min_runs=1)
+    combo_index, ing_index = dict(old_combo), dict(old_ing)
+    if Xb.shape[0]:
+        for c in sb["combo_index"]:
+            combo_index.setdefault(c, len(combo_index))
+        for i in sb["ingredient_index"]:
+            ing_index.setdefault(i, len(ing_index))
+    nc, ni = len(combo_index), len(ing_index)
+    p = nc + ni + 2
+
+    # old layout -> new layout (the blocks only grow at their ends)
+    old_cols = np.concatenate([
+        [combo_index[c] for c in sorted(old_combo, key=old_combo.get)],
+        [nc + ing_index[i] for i in sorted(old_ing, key=old_ing.get)],
+        [p - 2, p - 1],
+    ]).astype(np.int64)
+    XtX2 = np.zeros((p, p))
+    XtY2 = np.zeros((p, XtY.shape[1]))
+    XtX2[np.ix_(old_cols, old_cols)] = XtX
+    XtY2[old_cols] = XtY
+    if Xb.shape[0]:
+        Ymat = np.stack([Yb[t] for t in names], axis=1)
+        cols = np.concatenate([
+            [combo_index[c] for c in sorted(sb["combo_index"], key=sb["combo_index"].get)],
+            [nc + ing_index[i] for i in sorted(sb["ingredient_index"], key=sb["ingredient_index"].get)],
+            [p - 2, p - 1],
+        ]).astype(np.int64)
+        XtX2[np.ix_(cols, cols)] += Xb.gram()
+        XtY2[cols] += Xb.rmatvec(Ymat)
+        YtY += np.sum(Ymat ** 2, axis=0)
+        Ysum += np.sum(Ymat, axis=0)
+        n += Xb.shape[0]
+
+    schema = {"combo_index": combo_index, "ingredient_index": ing_index, "n_used": n}
+    solver = RidgeSolver.from_stats(XtX2, XtY2, YtY, Ysum, n)
+    if alpha is None:
+        alpha = model.get("alpha", 1.0)
+    out = _model_from_solver(solver, schema, names, alpha, gate_full, alphas, "gcv", keep_stats=True)
+    out["n_new"] = int(Xb.shape[0])
+    return out
 
 
 def predict(model: Dict[str, Any], combo_id: str, formulation: Dict[str, Any], end_ph: float, ferm_time_h: float):
@@ -119,6 +576,473 @@ def predict(model: Dict[str, Any], combo_id: str, formulation: Dict[str, Any], e
     x[offset + len(ing_index) + 0] = float(end_ph)
     x[offset + len(ing_index) + 1] = float(ferm_time_h)
 
-    w_sy = np.array(model["weights_syneresis"], dtype=float)
-    w_ov = np.array(model["weights_overall"], dtype=float)
+    w_sy = np.asarray(model["weights_syneresis"], dtype=float)
+    w_ov = np.asarray(model["weights_overall"], dtype=float)
     return float(x @ w_sy), float(x @ w_ov)
+
+
+# -----------------------------
+# Prediction cache
+# -----------------------------
+
+class LRUCache:
+    """Bounded, thread-safe LRU map with hit / miss counters."""
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = max(1, int(maxsize))
+        self._data: "OrderedDict[Any, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Any, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+def formulation_hash(formulation: Optional[Dict[str, Any]]) -> str:
+    """Canonical digest of a formulation's (ingredient_id, dosage_kg) sequence.
+
+    Only the fields that scoring reads take part: labels such as role / version
+    are ignored and dosages are rounded to 1e-6, so regenerated copies of the
+    same recipe share a key. Ingredient order is kept because the physical KPI
+    layer reads dosages by position.
+    """
+    items = [
+        [str(it.get("ingredient_id")), round(float(it.get("dosage_kg", 0.0)), 6)]
+        for it in (formulation or {}).get("ingredients", [])
+    ]
+    return hashlib.blake2b(json.dumps(items, separators=(",", ":")).encode("utf-8"), digest_size=16).hexdigest()
+
+
+PREDICTION_CACHE = LRUCache(int(os.environ.get("NUTRIWAVE_PREDICTION_CACHE_SIZE", "4096")))
+
+
+def prediction_cache_stats() -> Dict[str, Any]:
+    return PREDICTION_CACHE.stats()
+
+
+def invalidate_prediction_cache() -> None:
+    """Drop every cached prediction (storage calls this when a model is registered)."""
+    PREDICTION_CACHE.clear()
+
+
+class CompiledSurrogate:
+    """A surrogate model prepared once for repeated scoring.
+
+    Holds the weight vectors of every target stacked into one (p, n_targets)
+    matrix plus the schema's column maps, so predict_many() builds the feature
+    matrix for N candidates with array operations and scores them with a
+    single matrix multiply.
+
+    With cache=PREDICTION_CACHE (or any LRUCache) rows are memoised on
+    (model_id, strain_combo_id, formulation_hash, end_ph, ferm_time_h); only
+    the misses are featurised and scored. Models without a model_id are never
+    cached.
+    """
+
+    def __init__(self, model: Dict[str, Any], cache: Optional[LRUCache] = None):
+        schema = model["schema"]
+        self.combo_index: Dict[str, int] = dict(schema["combo_index"])
+        self.ingredient_index: Dict[str, int] = dict(schema["ingredient_index"])
+        self.n_combo = len(self.combo_index)
+        self.n_features = self.n_combo + len(self.ingredient_index) + 2
+        # syneresis / overall first (the order predict() returns), then any extra targets
+        keys = [k for k in model if k.startswith("weights_")]
+        keys.sort(key=lambda k: (["weights_syneresis", "weights_overall"] + [k]).index(k))
+        self.targets = tuple(k[len("weights_"):] for k in keys)
+        self.W = np.stack([np.asarray(model[k], dtype=float) for k in keys], axis=1)
+        self.model_id = model.get("model_id")
+        # ensemble members flattened to (p, B * n_targets): one matmul scores all of them
+        self.E: Optional[np.ndarray] = None
+        self.noise = np.array([float(model.get(f"rmse_{t}") or 0.0) for t in self.targets])
+        ens = model.get("ensemble_weights")
+        if ens is not None:
+            ens = np.asarray(ens, dtype=float)
+            self.n_members = ens.shape[0]
+            self.E = np.ascontiguousarray(ens.transpose(1, 0, 2).reshape(ens.shape[1], -1))
+        self.cache = cache if self.model_id else None
+        # cached rows hold the point scores and every member's, so one entry serves both calls
+        self._WE = self.W if self.E is None else np.hstack([self.W, self.E])
+
+    def features(
+        self, combo_ids: List[str], formulations: List[Dict[str, Any]], end_ph, ferm_time_h
+    ) -> np.ndarray:
+        """Feature matrix (N, p) laid out exactly like build_training_matrix."""
+        n = len(combo_ids)
+        X = np.zeros((n, self.n_features), dtype=float)
+        cols = np.fromiter((self.combo_index.get(c, -1) for c in combo_ids), dtype=np.int64, count=n)
+        hit = np.nonzero(cols >= 0)[0]
+        X[hit, cols[hit]] = 1.0
+
+        rows: List[int] = []
+        icols: List[int] = []
+        vals: List[float] = []
+        get = self.ingredient_index.get
+        for i, form in enumerate(formulations):
+            for it in (form or {}).get("ingredients", []):
+                j = get(it.get("ingredient_id"))
+                if j is not None:
+                    rows.append(i)
+                    icols.append(j)
+                    vals.append(float(it.get("dosage_kg", 0.0)))
+        if rows:
+            X[np.asarray(rows), self.n_combo + np.asarray(icols)] = vals
+
+        X[:, -2] = np.broadcast_to(np.asarray(end_ph, dtype=float), (n,))
+        X[:, -1] = np.broadcast_to(np.asarray(ferm_time_h, dtype=float), (n,))
+        return X
+
+    def design_matrix(
+        self, combo_ids: Sequence[str], ingredient_ids: Sequence[str], dosages: np.ndarray, end_ph, ferm_time_h
+    ) -> np.ndarray:
+        """features() for array-form candidates: dosages (N, I) of the ingredient_ids slots.
+
+        A repeated ingredient id counts at its last slot, as in features().
+        """
+        n = len(combo_ids)
+        X = np.zeros((n, self.n_features), dtype=float)
+        cols = np.fromiter((self.combo_index.get(c, -1) for c in combo_ids), dtype=np.int64, count=n)
+        hit = np.nonzero(cols >= 0)[0]
+        X[hit, cols[hit]] = 1.0
+        dosages = np.asarray(dosages, dtype=float)
+        for slot, ing in {ing: i for i, ing in enumerate(ingredient_ids)}.items():
+            j = self.ingredient_index.get(slot)
+            if j is not None:
+                X[:, self.n_combo + j] = dosages[:, ing]
+        X[:, -2] = np.broadcast_to(np.asarray(end_ph, dtype=float), (n,))
+        X[:, -1] = np.broadcast_to(np.asarray(ferm_time_h, dtype=float), (n,))
+        return X
+
+    def predict_many(
+        self, combo_ids: List[str], formulations: List[Dict[str, Any]], end_ph, ferm_time_h
+    ) -> np.ndarray:
+        """Scores (N, n_targets); end_ph / ferm_time_h may be scalars or length-N arrays."""
+        if self.cache is not None:
+            return self._cached_scores(combo_ids, formulations, end_ph, ferm_time_h)[:, : len(self.targets)]
+        return self.features(combo_ids, formulations, end_ph, ferm_time_h) @ self.W
+
+    def _cached_scores(
+        self, combo_ids: List[str], formulations: List[Dict[str, Any]], end_ph, ferm_time_h
+    ) -> np.ndarray:
+        n = len(combo_ids)
+        ph = np.broadcast_to(np.asarray(end_ph, dtype=float), (n,))
+        ft = np.broadcast_to(np.asarray(ferm_time_h, dtype=float), (n,))
+        out = np.empty((n, self._WE.shape[1]), dtype=float)
+        keys = [
+            (self.model_id, combo_ids[i], formulation_hash(formulations[i]), round(float(ph[i]), 6), round(float(ft[i]), 6))
+            for i in range(n)
+        ]
+        miss: List[int] = []
+        for i, key in enumerate(keys):
+            row = self.cache.get(key)
+            if row is None:
+                miss.append(i)
+            else:
+                out[i] = row
+        if miss:
+            X = self.features([combo_ids[i] for i in miss], [formulations[i] for i in miss], ph[miss], ft[miss])
+            scored = X @ self._WE
+            out[miss] = scored
+            for j, i in enumerate(miss):
+                self.cache.put(keys[i], scored[j])
+        return out
+
+    def predict(self, combo_id: str, formulation: Dict[str, Any], end_ph: float, ferm_time_h: float):
+        """(syneresis, overall) for one candidate, like the module-level predict()."""
+        sy, ov = self.predict_many([combo_id], [formulation], end_ph, ferm_time_h)[0, :2]
+        return float(sy), float(ov)
+
+    def predict_all(
+        self, combo_id: str, formulation: Dict[str, Any], end_ph: float, ferm_time_h: float
+    ) -> Dict[str, float]:
+        """Every target of the model for one candidate, keyed by target name."""
+        row = self.predict_many([combo_id], [formulation], end_ph, ferm_time_h)[0]
+        return {t: float(v) for t, v in zip(self.targets, row)}
+
+    def linear_terms(
+        self, combo_ids: Sequence[str], ingredient_ids: Sequence[str], end_ph: float, ferm_time_h: float
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """The point model split for array sweeps over dosages.
+
+        Returns offsets (C, n_targets), the score of each combo at the given
+        process settings with no ingredients, and coef (I, n_targets), the
+        per-kg contribution of each ingredient slot, so that the prediction for
+        combo c with dosages d (I,) is offsets[c] + d @ coef. As in features(),
+        a repeated ingredient id only counts at its last slot; ids missing
+        from the schema contribute nothing.
+        """
+        offsets = np.tile(float(end_ph) * self.W[-2] + float(ferm_time_h) * self.W[-1], (len(combo_ids), 1))
+        for i, c in enumerate(combo_ids):
+            j = self.combo_index.get(c)
+            if j is not None:
+                offsets[i] += self.W[j]
+        coef = np.zeros((len(ingredient_ids), self.W.shape[1]))
+        last = {ing: i for i, ing in enumerate(ingredient_ids)}
+        for ing, i in last.items():
+            j = self.ingredient_index.get(ing)
+            if j is not None:
+                coef[i] = self.W[self.n_combo + j]
+        return offsets, coef
+
+    @property
+    def has_ensemble(self) -> bool:
+        return self.E is not None
+
+    def predict_members(
+        self, combo_ids: List[str], formulations: List[Dict[str, Any]], end_ph, ferm_time_h
+    ) -> np.ndarray:
+        """Per-member predictions (N, B, n_targets) from one batched matmul."""
+        if self.E is None:
+            raise ValueError("Model has no ensemble_weights")
+        if self.cache is not None:
+            S = self._cached_scores(combo_ids, formulations, end_ph, ferm_time_h)[:, len(self.targets):]
+        else:
+            S = self.features(combo_ids, formulations, end_ph, ferm_time_h) @ self.E
+        return S.reshape(S.shape[0], self.n_members, len(self.targets))
+
+    def predict_interval(
+        self, combo_ids: List[str], formulations: List[Dict[str, Any]], end_ph, ferm_time_h, level: float = 0.9
+    ) -> Dict[str, np.ndarray]:
+        """Ensemble mean and a normal-approximation prediction interval per target.
+
+        The interval width combines the spread of the members (parameter
+        uncertainty) with the training RMSE (residual noise).
+        """
+        P = self.predict_members(combo_ids, formulations, end_ph, ferm_time_h)
+        mean = P.mean(axis=1)
+        std = np.sqrt(P.var(axis=1) + self.noise ** 2)
+        z = NormalDist().inv_cdf(0.5 + level / 2.0)
+        return {"mean": mean, "std": std, "lo": mean - z * std, "hi": mean + z * std, "members": P}
+
+
+# -----------------------------
+# Bayesian view for experiment design
+# -----------------------------
+
+# Chebyshev fit of erfc (Numerical Recipes erfcc), fractional error < 1.2e-7 everywhere
+_ERFC_COEF = (
+    -1.26551223, 1.00002368, 0.37409196, 0.09678418, -0.18628806,
+    0.27886807, -1.13520398, 1.48851587, -0.82215223, 0.17087277,
+)
+
+
+def _erfc(x: np.ndarray) -> np.ndarray:
+    """Elementwise erfc as array operations (no per-element Python calls)."""
+    x = np.asarray(x, dtype=float)
+    t = 1.0 / (1.0 + 0.5 * np.abs(x))
+    poly = np.zeros_like(t)
+    for c in reversed(_ERFC_COEF):
+        poly = poly * t + c
+    tail = t * np.exp(-x * x + poly)
+    return np.where(x >= 0, tail, 2.0 - tail)
+
+
+def _norm_pdf(z: np.ndarray) -> np.ndarray:
+    return np.exp(-0.5 * z ** 2) / math.sqrt(2.0 * math.pi)
+
+
+def _norm_cdf(z: np.ndarray) -> np.ndarray:
+    # via erfc so the lower tail keeps its relative accuracy (no 1 - erf cancellation)
+    return 0.5 * _erfc(-z / math.sqrt(2.0))
+
+
+class PosteriorSurrogate:
+    """Bayesian linear regression reading of a ridge surrogate.
+
+    Ridge with penalty alpha is the posterior mean under the prior
+    w ~ N(0, s2/alpha I) with noise variance s2, so with A = X^T X + alpha I
+    the weight posterior is N(W, s2 A^-1). The objective is a fixed
+    combination of the targets (default overall*10 - syneresis, the ranking
+    score); s2 comes from the training RMSEs, treating targets as independent.
+    Needs a keep_stats model for X^T X.
+
+    condition_on(x) adds a pending run by a rank-1 Sherman-Morrison update of
+    A^-1; the mean stays put (the outcome is not known yet), only the
+    variance near x shrinks.
+    """
+
+    def __init__(self, model: Dict[str, Any], weights: Optional[Dict[str, float]] = None):
+        if not has_stats(model):
+            raise ValueError("Model has no sufficient statistics; train it with keep_stats=True")
+        self.compiled = CompiledSurrogate(model)
+        weights = weights or {"overall": 10.0, "syneresis": -1.0}
+        c = np.array([float(weights.get(t, 0.0)) for t in self.compiled.targets])
+        self.w = self.compiled.W @ c
+        self.s2 = float(np.sum((c * self.compiled.noise) ** 2))
+        XtX = np.asarray(model["stats_xtx"], dtype=float)
+        self.A_inv = np.linalg.inv(XtX + float(model.get("alpha", 1.0)) * np.eye(XtX.shape[0]))
+
+    def mean(self, X: np.ndarray) -> np.ndarray:
+        return X @ self.w
+
+    def var(self, X: np.ndarray) -> np.ndarray:
+        """Posterior variance of the mean objective at each row (noise excluded)."""
+        return self.s2 * np.einsum("ij,ij->i", X @ self.A_inv, X)
+
+    def condition_on(self, x: np.ndarray) -> np.ndarray:
+        """Fold one pending design point into A^-1 and return u, where A^-1 <- A^-1 - u u^T."""
+        u = self.A_inv @ x
+        u /= math.sqrt(1.0 + float(x @ u))
+        self.A_inv -= np.outer(u, u)
+        return u
+
+
+def propose_batch(
+    post: PosteriorSurrogate,
+    X: np.ndarray,
+    q: int = 24,
+    acquisition: str = "ei",
+    beta: float = 2.0,
+    best: Optional[float] = None,
+    xi: float = 0.0,
+    Z: Optional[np.ndarray] = None,
+    length_scale: float = 0.0,
+) -> List[Dict[str, Any]]:
+    """Greedy batch of q rows of the candidate pool X (N, p).
+
+    acquisition="ei" is expected improvement over `best` (default: the best
+    posterior mean in the pool), "ucb" is mean + beta * std. After each pick
+    the posterior is conditioned on it in closed form (kriging believer:
+    variances shrink by (x_i^T u)^2, `best` rises to the pick's mean), so
+    each pick costs O(N p) and nothing is refit. With Z (N, d) coordinates
+    and length_scale > 0 the acquisition is also multiplied by
+    1 - exp(-d^2 / (2 l^2)) for the distance d to every earlier pick.
+    """
+    if acquisition not in ("ei", "ucb"):
+        raise ValueError(f"Unknown acquisition: {acquisition}")
+    X = np.asarray(X, dtype=float)
+    mu = post.mean(X)
+    var = post.var(X)
+    best = float(mu.max()) if best is None else float(best)
+    penalty = np.ones(len(X))
+    taken = np.zeros(len(X), dtype=bool)
+    picks: List[Dict[str, Any]] = []
+    for _ in range(min(int(q), len(X))):
+        sd = np.sqrt(np.clip(var, 0.0, None))
+        if acquisition == "ei":
+            gain = mu - best - xi
+            z = gain / np.maximum(sd, 1e-12)
+            acq = np.where(sd > 0, gain * _norm_cdf(z) + sd * _norm_pdf(z), np.maximum(gain, 0.0))
+        else:
+            acq = mu + beta * sd
+            acq = acq - acq.min()  # non-negative, so the distance penalty scales it down
+        score = np.where(taken, -np.inf, acq * penalty)
+        i = int(np.argmax(score))
+        picks.append({"index": i, "mean": float(mu[i]), "std": float(sd[i]), "acquisition": float(acq[i])})
+        taken[i] = True
+        u = post.condition_on(X[i])
+        var = var - post.s2 * (X @ u) ** 2
+        best = max(best, float(mu[i]))
+        if Z is not None and length_scale > 0:
+            d2 = np.sum((Z - Z[i]) ** 2, axis=1)
+            penalty *= 1.0 - np.exp(-0.5 * d2 / length_scale ** 2)
+    return picks
+
+
+# -----------------------------
+# Binary model artifacts (.npz)
+# -----------------------------
+# Weight vectors are stored as uncompressed .npy members so they can be mapped
+# straight from disk; schema and training metadata ride along as JSON strings.
+
+ARRAY_KEY_PREFIXES: Tuple[str, ...] = ("weights_", "stats_", "ensemble_weights")
+
+
+def is_array_key(key: str) -> bool:
+    """Model fields stored as binary arrays in the artifact rather than in models.jsonl."""
+    return key.startswith(ARRAY_KEY_PREFIXES)
+
+
+def save_model_artifact(model: Dict[str, Any], path: Path) -> None:
+    """Write a trained model to `path` (.npz): array fields (is_array_key) + schema + metadata."""
+    arrays: Dict[str, np.ndarray] = {}
+    meta: Dict[str, Any] = {}
+    for key, val in model.items():
+        if is_array_key(key):
+            arrays[key] = np.asarray(val, dtype=float)
+        elif key != "schema":
+            meta[key] = val
+    arrays["schema_json"] = np.array(json.dumps(model.get("schema") or {}, ensure_ascii=False))
+    arrays["meta_json"] = np.array(json.dumps(meta, ensure_ascii=False, default=str))
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as f:
+        np.savez(f, **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _mmap_npz_member(path: Path, info: zipfile.ZipInfo):
+    """Memory-map one stored (uncompressed) .npy member; None if it cannot be mapped."""
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+    fmt = np.lib.format
+    with open(path, "rb") as f:
+        f.seek(info.header_offset)
+        local = f.read(30)
+        name_len, extra_len = struct.unpack("<HH", local[26:30])
+        f.seek(info.header_offset + 30 + name_len + extra_len)
+        version = fmt.read_magic(f)
+        read_header = {(1, 0): fmt.read_array_header_1_0, (2, 0): fmt.read_array_header_2_0}.get(version)
+        if read_header is None:
+            return None
+        shape, fortran, dtype = read_header(f)
+        offset = f.tell()
+    if dtype.hasobject or dtype.kind not in "biuf" or not shape or 0 in shape:
+        return None
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape, order="F" if fortran else "C")
+
+
+def load_model_artifact(path: Path) -> Dict[str, Any]:
+    """Inverse of save_model_artifact; weight arrays come back as read-only memmaps."""
+    path = Path(path)
+    out: Dict[str, Any] = {}
+    with zipfile.ZipFile(path) as zf:
+        for info in zf.infolist():
+            name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            arr = _mmap_npz_member(path, info)
+            if arr is None:
+                with zf.open(info) as member:
+                    arr = np.lib.format.read_array(member, allow_pickle=False)
+            if name == "schema_json":
+                out["schema"] = json.loads(arr.item())
+            elif name == "meta_json":
+                out.update({k: v for k, v in json.loads(arr.item()).items() if k not in out})
+            else:
+                out[name] = arr
+    return out
@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+"""SQLite persistence for core.storage.
+
+Selected with NUTRIWAVE_STORAGE_BACKEND=sqlite (or storage.set_storage_backend).
+The public storage.py API is unchanged; storage routes its JSONL primitives here.
+
+Layout:
+- one table per get_admin_paths() / get_legacy_paths() entry, keyed by the real
+  primary key column; an upsert replaces the row in place, so row order matches
+  the first-seen order produced by _latest_by_id on the JSONL log, and stamps
+  write_seq so "the last N writes" can still be told apart from first-seen order;
+- one append-only table per log (runs, models, qc_feedback, batch_sop_locks).
+
+The database runs in WAL mode so several Streamlit sessions can read while one
+writes. Each thread keeps one connection per database (closed when the thread
+exits); the schema is created once per database and process. Run `python -m core.sqlite_backend` once to import the existing JSONL files.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+import json
+import sqlite3
+import sys
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+try:  # works both in the original package layout and in a flat layout
+    from core import storage as _storage
+except ModuleNotFoundError:  # pragma: no cover - local artifact convenience only
+    import storage as _storage
+
+
+# Foreign-key style fields worth an expression index (json_extract on the record).
+FK_INDEXES: Dict[str, Tuple[str, ...]] = _storage.FK_FIELDS
+
+_local = threading.local()
+_SCHEMA_LOCK = threading.Lock()
+_SCHEMA_READY: set = set()
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def table_specs() -> Dict[str, Tuple[str, Optional[str]]]:
+    """Return str(jsonl path) -> (sqlite table, primary key or None for logs)."""
+    out: Dict[str, Tuple[str, Optional[str]]] = {}
+    for name, (path, pk) in _storage.get_admin_paths().items():
+        out[str(path)] = (name, pk)
+    for name, (path, pk) in _storage.get_legacy_paths().items():
+        out[str(path)] = (f"legacy_{name}", pk)
+    for name, path in _storage.get_log_paths().items():
+        out[str(path)] = (name, None)
+    return out
+
+
+def _spec(path: Path) -> Tuple[str, Optional[str]]:
+    spec = table_specs().get(str(path))
+    if spec is None:
+        raise ValueError(f"No SQLite table mapped for {path}")
+    return spec
+
+
+def _create_schema(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS _table_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)"
+    )
+    for table, pk in table_specs().values():
+        t = _quote(table)
+        if pk:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {t} ("
+                f"{_quote(pk)} TEXT PRIMARY KEY, "
+                "is_deleted INTEGER NOT NULL DEFAULT 0, "
+                "timestamp_utc TEXT, "
+                "write_seq INTEGER, "
+                "data TEXT NOT NULL)"
+            )
+            if "write_seq" not in {row[1] for row in conn.execute(f"PRAGMA table_info({t})")}:
+                # databases created before write_seq: existing rows keep their insertion order
+                conn.execute(f"ALTER TABLE {t} ADD COLUMN write_seq INTEGER")
+                conn.execute(f"UPDATE {t} SET write_seq = rowid")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {_quote('ix_' + table + '_live')} ON {t}(is_deleted)")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {_quote('ix_' + table + '_write_seq')} ON {t}(write_seq)")
+            for col in FK_INDEXES.get(table, ()):
+                conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS {_quote('ix_' + table + '_' + col)} "
+                    f"ON {t}(json_extract(data, '$.{col}'))"
+                )
+        else:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {t} ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "model_type TEXT, "
+                "timestamp_utc TEXT, "
+                "data TEXT NOT NULL)"
+            )
+            if table == "models":
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {_quote('ix_models_type')} ON {t}(model_type, seq)")
+
+
+class _ThreadConnections(dict):
+    """db path -> connection for one thread; closed when the thread-local is dropped at thread exit."""
+
+    def close(self) -> None:
+        for conn in self.values():
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self.clear()
+
+    def __del__(self):
+        self.close()
+
+
+def connect(db_path: Optional[Path] = None) -> sqlite3.Connection:
+    """Return this thread's connection to the database (created on first use)."""
+    db_path = Path(db_path or _storage.SQLITE_PATH)
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = _ThreadConnections()
+    conn = conns.get(str(db_path))
+    if conn is None:
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(db_path), timeout=30.0, isolation_level=None)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        with _SCHEMA_LOCK:
+            if str(db_path) not in _SCHEMA_READY:
+                conn.execute("PRAGMA journal_mode=WAL")  # persistent: stored in the database file
+                with conn:
+                    _create_schema(conn)
+                _SCHEMA_READY.add(str(db_path))
+        conns[str(db_path)] = conn
+    return conn
+
+
+def close_connections() -> None:
+    """Close the calling thread's connections (they are reopened on next use)."""
+    conns = getattr(_local, "conns", None)
+    if conns is not None:
+        conns.close()
+
+
+def _insert(conn: sqlite3.Connection, table: str, pk: Optional[str], rec: Dict[str, Any]) -> None:
+    t = _quote(table)
+    data = json.dumps(rec, ensure_ascii=False)
+    if pk:
+        _id = rec.get(pk)
+        if _id is None:
+            raise ValueError(f"Missing primary key: {pk}")
+        conn.execute(
+            f"INSERT INTO {t} ({_quote(pk)}, is_deleted, timestamp_utc, write_seq, data) "
+            f"VALUES (?, ?, ?, (SELECT COALESCE(MAX(write_seq), 0) + 1 FROM {t}), ?) "
+            f"ON CONFLICT({_quote(pk)}) DO UPDATE SET "
+            "is_deleted = excluded.is_deleted, timestamp_utc = excluded.timestamp_utc, "
+            "write_seq = excluded.write_seq, data = excluded.data",
+            (str(_id), 1 if rec.get("is_deleted", False) else 0, rec.get("timestamp_utc"), data),
+        )
+    else:
+        conn.execute(
+            f"INSERT INTO {t} (model_type, timestamp_utc, data) VALUES (?, ?, ?)",
+            (rec.get("model_type"), rec.get("timestamp_utc"), data),
+        )
+
+
+def _bump_version(conn: sqlite3.Connection, table: str) -> None:
+    conn.execute(
+        "INSERT INTO _table_versions (name, version) VALUES (?, 1) "
+        "ON CONFLICT(name) DO UPDATE SET version = version + 1",
+        (table,),
+    )
+
+
+def table_version(path: Path) -> int:
+    """Change counter of a table, bumped in the same transaction as every write.
+
+    Lets storage's load cache see writes made by other processes per table,
+    which the database file's mtime cannot tell apart.
+    """
+    table, _ = _spec(path)
+    row = connect().execute("SELECT version FROM _table_versions WHERE name = ?", (table,)).fetchone()
+    return int(row[0]) if row else 0
+
+
+def append_records(path: Path, records: List[Dict[str, Any]]) -> None:
+    """Write records (already stamped by storage) in a single transaction."""
+    table, pk = _spec(path)
+    conn = connect()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for rec in records:
+            _insert(conn, table, pk, rec)
+        _bump_version(conn, table)
+
+
+def read_records(path: Path, limit: int = 10000) -> List[Dict[str, Any]]:
+    """Mirror of storage._read_jsonl: last `limit` records (0 = all), oldest first.
+
+    Keyed tables hold one row per primary key (tombstones included), which is
+    all _latest_by_id / _merge need from the history. The window is the rows
+    written last (write_seq, so a recent edit of an old row is inside it),
+    returned in first-seen (rowid) order.
+    """
+    table, pk = _spec(path)
+    t = _quote(table)
+    order, recent = ("rowid", "write_seq") if pk else ("seq", "seq")
+    sql = f"SELECT data FROM {t} ORDER BY {order}"
+    if limit and limit > 0:
+        sql = (
+            f"SELECT data FROM (SELECT {order} AS o, data FROM {t} ORDER BY {recent} DESC LIMIT {int(limit)}) "
+            "ORDER BY o"
+        )
+    return [json.loads(row[0]) for row in connect().execute(sql)]
+
+
+def load_table(path: Path, limit: int = 20000) -> List[Dict[str, Any]]:
+    """Mirror of storage._load_table: live rows only, first-seen order."""
+    table, pk = _spec(path)
+    if not pk:
+        raise ValueError(f"{table} is a log table without a primary key")
+    sql = f"SELECT data FROM {_quote(table)} WHERE is_deleted = 0 ORDER BY rowid"
+    return [json.loads(row[0]) for row in connect().execute(sql)][-limit:]
+
+
+def read_log_since(path: Path, after_seq: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+    """Log records with seq > after_seq, oldest first, and the last seq seen."""
+    table, pk = _spec(path)
+    if pk:
+        raise ValueError(f"{table} is keyed, not a log table")
+    rows = connect().execute(f"SELECT seq, data FROM {_quote(table)} WHERE seq > ? ORDER BY seq", (int(after_seq),)).fetchall()
+    return [json.loads(d) for _, d in rows], (rows[-1][0] if rows else int(after_seq))
+
+
+def latest_model(path: Path, model_type: str) -> Optional[Dict[str, Any]]:
+    """Newest live record of a model_type, via the (model_type, seq) index."""
+    table, _ = _spec(path)
+    sql = f"SELECT data FROM {_quote(table)} WHERE model_type = ? ORDER BY seq DESC"
+    for (data,) in connect().execute(sql, (model_type,)):
+        rec = json.loads(data)
+        if not rec.get("is_deleted", False):
+            return rec
+    return None
+
+
+def get_by_ids(path: Path, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Indexed primary-key lookup of live rows."""
+    table, pk = _spec(path)
+    if not pk:
+        raise ValueError(f"{table} is a log table without a primary key")
+    out: Dict[str, Dict[str, Any]] = {}
+    conn = connect()
+    ids = list(dict.fromkeys(ids))
+    for i in range(0, len(ids), 500):
+        chunk = ids[i: i + 500]
+        sql = (
+            f"SELECT {_quote(pk)}, data FROM {_quote(table)} "
+            f"WHERE is_deleted = 0 AND {_quote(pk)} IN ({','.join('?' * len(chunk))})"
+        )
+        for _id, data in conn.execute(sql, chunk):
+            out[_id] = json.loads(data)
+    return out
+
+
+def find_by(path: Path, field: str, values: List[str]) -> List[Dict[str, Any]]:
+    """Live rows whose `field` is in `values`, via the json_extract expression index."""
+    table, _ = _spec(path)
+    if field not in FK_INDEXES.get(table, ()):
+        raise ValueError(f"No index on {table}.{field}")
+    out: List[Dict[str, Any]] = []
+    conn = connect()
+    values = list(dict.fromkeys(values))
+    for i in range(0, len(values), 500):
+        chunk = values[i: i + 500]
+        sql = (
+            f"SELECT data FROM {_quote(table)} WHERE is_deleted = 0 "
+            f"AND json_extract(data, '$.{field}') IN ({','.join('?' * len(chunk))}) ORDER BY rowid"
+        )
+        out.extend(json.loads(row[0]) for row in conn.execute(sql, chunk))
+    return out
+
+
+def compact(path: Path, keep_tombstones: bool = False) -> Dict[str, Any]:
+    """Keyed tables keep no edit history; compaction only purges tombstone rows."""
+    table, pk = _spec(path)
+    conn = connect()
+    t = _quote(table)
+    n_before = conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+    n_tomb = conn.execute(f"SELECT COUNT(*) FROM {t} WHERE is_deleted = 1").fetchone()[0] if pk else 0
+    dropped = 0
+    if pk and n_tomb and not keep_tombstones:
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            dropped = conn.execute(f"DELETE FROM {t} WHERE is_deleted = 1").rowcount
+            _bump_version(conn, table)
+    return {
+        "table": table,
+        "records_before": n_before,
+        "records_after": n_before - dropped,
+        "dropped": dropped,
+        "tombstones": n_tomb,
+        "tombstone_ratio": round(n_tomb / n_before, 4) if n_before else 0.0,
+    }
+
+
+def migrate_from_jsonl(db_path: Optional[Path] = None, overwrite: bool = False) -> Dict[str, int]:
+    """One-shot import of every JSONL file into SQLite.
+
+    Tables that already hold rows are skipped (reported as -1) unless
+    overwrite=True, so running the tool twice does not duplicate the logs.
+    """
+    conn = connect(db_path)
+    out: Dict[str, int] = {}
+    for path_str, (table, pk) in table_specs().items():
+        t = _quote(table)
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            n_existing = conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+            if n_existing and not overwrite:
+                out[table] = -1
+                continue
+            conn.execute(f"DELETE FROM {t}")
+            records = _storage._read_jsonl_file(Path(path_str), limit=0, shared=True)
+            if pk:
+                # rows without a primary key are invisible to every keyed read; leave them behind
+                records = [r for r in records if r.get(pk) is not None]
+            for rec in records:
+                _insert(conn, table, pk, rec)
+            _bump_version(conn, table)
+            out[table] = len(records)
+    return out
+
+
+if __name__ == "__main__":  # pragma: no cover - manual migration entry point
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    target = Path(args[0]) if args else None
+    for name, n in migrate_from_jsonl(target, overwrite="--overwrite" in sys.argv).items():
+        print(f"{name}: {'skipped (not empty)' if n < 0 else n}")
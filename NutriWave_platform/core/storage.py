@@ -2,9 +2,22 @@
 from __future__ import annotations
 
 from pathlib import Path
+import copy
 import json
+import mmap
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from typing import Dict, Any, List, Optional, Tuple
+from uuid import uuid4
+
+try:  # POSIX advisory locks; on platforms without fcntl appends are unlocked
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
 
 
 # -----------------------------
@@ -29,6 +42,8 @@ P_RUN = ROOT / "data" / "runs.jsonl"
 P_MODEL = ROOT / "data" / "models.jsonl"
 P_QC_FEEDBACK = ROOT / "data" / "qc_feedback.jsonl"
 P_SOP_LOCKS = ROOT / "data" / "batch_sop_locks.jsonl"
+# Binary model artifacts (<model_id>.npz) referenced by models.jsonl rows
+MODEL_DIR = ROOT / "data" / "models"
 
 # New Admin Database (Row1–Row6 redesigned)
 P2_SUPPLIERS = ROOT / "data" / "admin_suppliers.jsonl"
@@ -47,33 +62,366 @@ P2_RESULTS = ROOT / "data" / "admin_run_results.jsonl"
 P2_MODEL_RUNS = ROOT / "data" / "admin_model_runs.jsonl"
 P2_MODEL_PRED = ROOT / "data" / "admin_model_predictions.jsonl"
 
+# Optional automatic compaction (see compact_table). Off unless NUTRIWAVE_AUTO_COMPACT=1.
+AUTO_COMPACT = os.environ.get("NUTRIWAVE_AUTO_COMPACT", "").lower() in ("1", "true", "yes")
+AUTO_COMPACT_MIN_RECORDS = 500
+AUTO_COMPACT_DEAD_RATIO = 0.5
+
+# Persistence backend: "jsonl" (default, files above) or "sqlite" (core/sqlite_backend.py).
+STORAGE_BACKEND = os.environ.get("NUTRIWAVE_STORAGE_BACKEND", "jsonl").strip().lower()
+SQLITE_PATH = Path(os.environ.get("NUTRIWAVE_SQLITE_PATH", str(ROOT / "data" / "nutriwave.db")))
+
+
+def set_storage_backend(backend: str, sqlite_path: Optional[Path] = None) -> None:
+    """Switch persistence at runtime ("jsonl" or "sqlite"); the public API is unchanged."""
+    global STORAGE_BACKEND, SQLITE_PATH
+    backend = backend.strip().lower()
+    if backend not in ("jsonl", "sqlite"):
+        raise ValueError(f"Unknown storage backend: {backend}")
+    STORAGE_BACKEND = backend
+    if sqlite_path is not None:
+        SQLITE_PATH = Path(sqlite_path)
+
+
+def _use_sqlite() -> bool:
+    return STORAGE_BACKEND == "sqlite"
+
+
+def _modeling():
+    try:
+        from core import modeling
+    except ModuleNotFoundError:  # pragma: no cover - flat layout
+        import modeling
+    return modeling
+
+
+def _sqlite():
+    try:
+        from core import sqlite_backend
+    except ModuleNotFoundError:  # pragma: no cover - flat layout
+        import sqlite_backend
+    return sqlite_backend
+
 
 # -----------------------------
 # JSONL helpers
 # -----------------------------
 
-def _read_jsonl(path: Path, limit: int = 10000) -> List[Dict[str, Any]]:
-    if not path.exists():
-        return []
+def _parse_jsonl_line(line: bytes) -> Optional[Dict[str, Any]]:
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        return json.loads(line)
+    except Exception:
+        return None
+
+
+def _parse_jsonl_bytes(chunk: bytes) -> List[Dict[str, Any]]:
     out: List[Dict[str, Any]] = []
-    with path.open("r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
+    for line in chunk.split(b"\n"):
+        rec = _parse_jsonl_line(line)
+        if rec is not None:
+            out.append(rec)
+    return out
+
+
+class _JsonlReader:
+    """Incremental reader for one append-only JSONL file.
+
+    Remembers the byte offset of the last complete line and the records parsed
+    so far, so a later refresh() only parses bytes appended since. A changed
+    inode (rotation / atomic rewrite), a file shorter than the offset
+    (truncation) or a new mtime at an unchanged size (in-place rewrite) falls
+    back to a full rescan. Whenever size or mtime moved, the first and last
+    _MARK_BYTES of the already-parsed prefix are also compared with what was
+    read, so an in-place rewrite to an equal or larger size is caught too.
+    `generation` is bumped on every rescan so derived state can tell
+    "appended" from "replaced".
+    """
+
+    _MARK_BYTES = 1024
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.records: List[Dict[str, Any]] = []
+        self.offset = 0
+        self.inode: Optional[int] = None
+        self.size = -1
+        self.mtime_ns = -1
+        self.marks = b""
+        self.generation = 0
+
+    def _reset(self) -> None:
+        self.records = []
+        self.offset = 0
+        self.inode = None
+        self.size = -1
+        self.mtime_ns = -1
+        self.marks = b""
+        self.generation += 1
+
+    def _read_marks(self) -> bytes:
+        # head and tail of the parsed prefix [0, offset)
+        n = min(self.offset, self._MARK_BYTES)
+        if not n:
+            return b""
+        with open(self.path, "rb") as f:
+            head = f.read(n)
+            f.seek(self.offset - n)
+            return head + f.read(n)
+
+    def refresh(self) -> List[Dict[str, Any]]:
+        with self.lock:
             try:
-                out.append(json.loads(line))
-            except Exception:
-                continue
-    return out[-limit:]
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                if self.inode is not None or self.records:
+                    self._reset()
+                return self.records
+
+            moved = st.st_size != self.size or st.st_mtime_ns != self.mtime_ns
+            rotated = (
+                (self.inode is not None and st.st_ino != self.inode)
+                or st.st_size < self.offset
+                or (st.st_size == self.size and st.st_mtime_ns != self.mtime_ns)
+                or (moved and self.offset > 0 and self._read_marks() != self.marks)
+            )
+            if rotated:
+                self._reset()
+
+            if self.inode is None or st.st_size > self.offset:
+                with open(self.path, "rb") as f:
+                    f.seek(self.offset)
+                    chunk = f.read()
+                    end = chunk.rfind(b"\n")
+                    if end >= 0:
+                        # a trailing partial line is left for the next refresh
+                        self.records.extend(_parse_jsonl_bytes(chunk[: end + 1]))
+                        self.offset += end + 1
+                    st = os.fstat(f.fileno())
+                self.marks = self._read_marks()
+            self.inode = st.st_ino
+            self.size = st.st_size
+            self.mtime_ns = st.st_mtime_ns
+            return self.records
+
+
+_READERS: Dict[str, _JsonlReader] = {}
+_READERS_LOCK = threading.Lock()
+
+
+def _reader(path: Path) -> _JsonlReader:
+    key = str(path)
+    with _READERS_LOCK:
+        r = _READERS.get(key)
+        if r is None:
+            r = _READERS[key] = _JsonlReader(path)
+        return r
+
+
+def _read_jsonl_file(path: Path, limit: int = 10000, shared: bool = False) -> List[Dict[str, Any]]:
+    # Parsed records are cached per process; only newly appended lines are parsed.
+    # Callers get deep copies, so mutating a result never leaks into the next read;
+    # shared=True hands out the reader's own dicts to internal callers that neither
+    # mutate nor return them.
+    records = _reader(path).refresh()[-limit:]
+    return records if shared else copy.deepcopy(records)
+
+
+def _iter_jsonl_reverse(path: Path, block_size: int = 1 << 16):
+    """Yield parsed records newest-first, reading the file backwards in blocks.
+
+    A trailing line without its newline is treated as still being written and skipped.
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return
+    with f:
+        pos = f.seek(0, os.SEEK_END)
+        tail = b""
+        trimmed = False
+        while pos > 0:
+            step = min(block_size, pos)
+            pos -= step
+            f.seek(pos)
+            tail = f.read(step) + tail
+            if not trimmed:
+                cut = tail.rfind(b"\n")
+                if cut < 0:
+                    continue
+                tail = tail[:cut]
+                trimmed = True
+            lines = tail.split(b"\n")
+            tail = lines[0]
+            for line in reversed(lines[1:]):
+                rec = _parse_jsonl_line(line)
+                if rec is not None:
+                    yield rec
+        if trimmed:
+            rec = _parse_jsonl_line(tail)
+            if rec is not None:
+                yield rec
+
+
+def _read_jsonl_tail(path: Path, limit: int) -> List[Dict[str, Any]]:
+    """Last `limit` records without parsing the rest of the file (limit <= 0 reads everything)."""
+    if limit <= 0:
+        return _read_jsonl_file(path, limit)
+    out: List[Dict[str, Any]] = []
+    for rec in _iter_jsonl_reverse(path):
+        out.append(rec)
+        if len(out) >= limit:
+            break
+    out.reverse()
+    return out
 
 
-def _append_jsonl(path: Path, record: Dict[str, Any]) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
+def _read_jsonl(path: Path, limit: int = 10000, tail: bool = False, shared: bool = False) -> List[Dict[str, Any]]:
+    """Last `limit` records of a log (fresh dicts the caller owns; see _read_jsonl_file for shared).
+
+    tail=True is for logs whose callers only want the recent end (models.jsonl):
+    unless the incremental reader already holds the file, it seeks backwards from
+    EOF instead of parsing the whole history.
+    """
+    if _use_sqlite():
+        return _sqlite().read_records(path, limit)
+    if tail and _reader(path).inode is None:
+        return _read_jsonl_tail(path, limit)
+    return _read_jsonl_file(path, limit, shared=shared)
+
+
+def _stamp(record: Dict[str, Any]) -> Dict[str, Any]:
     rec = dict(record)
     rec.setdefault("timestamp_utc", datetime.utcnow().isoformat())
-    with path.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    return rec
+
+
+def _encode_line(rec: Dict[str, Any]) -> bytes:
+    return (json.dumps(rec, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+@contextmanager
+def _file_lock(path: Path):
+    """Exclusive advisory lock shared by every process writing `path`.
+
+    The lock lives on a sidecar <file>.lock rather than the data file itself, so
+    it stays valid across compaction's atomic rename. Readers never take it.
+    """
+    if fcntl is None:
+        yield
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(str(path.with_name(path.name + ".lock")), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)  # closing the descriptor releases the lock
+
+
+def _write_lines(path: Path, payload: bytes, fsync: bool = False) -> None:
+    """Append complete lines with one O_APPEND write under the table's file lock.
+
+    Concurrent writers (other sessions / processes) therefore never interleave
+    or tear records, and readers only ever see whole lines plus, at worst, a
+    trailing line still being written (which they leave for the next refresh).
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with _file_lock(path):
+        fd = os.open(str(path), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            view = memoryview(payload)
+            while view:
+                view = view[os.write(fd, view):]
+            if fsync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def _append_jsonl(path: Path, record: Dict[str, Any]) -> None:
+    rec = _stamp(record)
+    if _use_sqlite():
+        _sqlite().append_records(path, [rec])
+    else:
+        _write_lines(path, _encode_line(rec))
+    _bump_version(path)
+
+
+def append_many(path: Path, records: List[Dict[str, Any]], fsync: bool = False) -> None:
+    """Append many records with one open and one buffered write (one transaction on SQLite)."""
+    recs = [_stamp(r) for r in records]
+    if not recs:
+        return
+    if _use_sqlite():
+        _sqlite().append_records(path, recs)
+    else:
+        _write_lines(path, b"".join(_encode_line(r) for r in recs), fsync=fsync)
+    _bump_version(path)
+
+
+# -----------------------------
+# Change-validated load cache
+# -----------------------------
+# load_data() / load_admin_db() results are kept per table for the whole process
+# (shared by every Streamlit session) and reused while the table is unchanged:
+# its file's (mtime, size, inode) -- or, on SQLite, the table's change counter --
+# plus a per-table version bumped by every write helper in this module.
+
+_TABLE_VERSIONS: Dict[str, int] = {}
+_LOAD_CACHE: Dict[str, Tuple[Any, Any]] = {}
+_CACHE_LOCK = threading.Lock()
+
+
+def _bump_version(path: Path) -> None:
+    with _CACHE_LOCK:
+        _TABLE_VERSIONS[str(path)] = _TABLE_VERSIONS.get(str(path), 0) + 1
+
+
+def table_version(path: Path) -> int:
+    """In-process write counter of a table file (bumped on every append)."""
+    return _TABLE_VERSIONS.get(str(path), 0)
+
+
+def _file_signature(path: Path) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def _table_signature(path: Path) -> Tuple[Any, ...]:
+    if _use_sqlite():
+        return ("sqlite", str(SQLITE_PATH), _sqlite().table_version(path), table_version(path))
+    return (_file_signature(path), table_version(path))
+
+
+def admin_table_signature(table: str) -> Tuple[Any, ...]:
+    """Change token of an admin table: equal tokens mean the table is unchanged."""
+    return _table_signature(get_admin_paths()[table][0])
+
+
+def _cached(slot: str, key: Any, loader):
+    # The key is taken before loading: a write racing the load leaves a stale key
+    # behind, which only costs one extra reload on the next call.
+    with _CACHE_LOCK:
+        hit = _LOAD_CACHE.get(slot)
+    if hit is not None and hit[0] == key:
+        return hit[1]
+    value = loader()
+    with _CACHE_LOCK:
+        _LOAD_CACHE[slot] = (key, value)
+    return value
+
+
+def invalidate_storage_cache() -> None:
+    """Drop every cached table (the next load re-validates from disk)."""
+    with _CACHE_LOCK:
+        _LOAD_CACHE.clear()
 
 
 def _latest_by_id(records: List[Dict[str, Any]], id_key: str) -> Dict[str, Dict[str, Any]]:
@@ -112,25 +460,40 @@ def load_data() -> Dict[str, Any]:
 
     NOTE: This is intentionally kept stable so the Recipe Engine remains unchanged.
     The new Admin Database is loaded via load_admin_db().
+    Each merged section is cached and re-merged only when data.json or that
+    overlay changed, so repeated calls are cheap. The returned data is a deep
+    copy: callers may mutate it without touching the cache.
     """
+    for _path, _id_key in get_legacy_paths().values():
+        _maybe_compact(_path, _id_key, keep_tombstones=True)
+
+    seed_sig = _file_signature(DATA_PATH)
+    seed = _cached("data.json", seed_sig, _read_seed)
+    data = dict(seed)
+
+    def _section(name: str, seed_rows: List[Dict[str, Any]], path: Path, id_key: str, keep=None):
+        def build() -> List[Dict[str, Any]]:
+            ov = _read_jsonl(path, shared=True)
+            if keep is not None:
+                ov = [x for x in ov if keep(x)]
+            return _merge(seed_rows, ov, id_key)
+        return _cached("legacy:" + name, (seed_sig, _table_signature(path)), build)
+
+    seed_combo = [x for x in seed.get("strains", []) if x.get("kind") == "combo"]
+    data["strains"] = _section(
+        "strains", seed_combo, P_STR, "strain_combo_id",
+        keep=lambda x: x.get("kind") == "combo" or x.get("strain_combo_id") is not None,
+    )
+    data["ingredients"] = _section("ingredients", seed.get("ingredients", []), P_ING, "ingredient_id")
+    data["rheo_methods"] = _section("rheo_methods", seed.get("rheo_methods", []), P_RHEO, "rheo_method_id")
+    data["suppliers"] = _section("suppliers", seed.get("suppliers", []), P_SUP, "supplier_id")
+    data["formulations"] = _section("formulations", seed.get("formulations", []), P_FORM, "formulation_id")
+    return copy.deepcopy(data)
+
+
+def _read_seed() -> Dict[str, Any]:
     with DATA_PATH.open("r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    ov_str = _read_jsonl(P_STR)
-    ov_ing = _read_jsonl(P_ING)
-    ov_rheo = _read_jsonl(P_RHEO)
-    ov_sup = _read_jsonl(P_SUP)
-    ov_form = _read_jsonl(P_FORM)
-
-    seed_combo = [x for x in data.get("strains", []) if x.get("kind") == "combo"]
-    ov_combo = [x for x in ov_str if x.get("kind") == "combo" or x.get("strain_combo_id") is not None]
-    data["strains"] = _merge(seed_combo, ov_combo, "strain_combo_id")
-
-    data["ingredients"] = _merge(data.get("ingredients", []), ov_ing, "ingredient_id")
-    data["rheo_methods"] = _merge(data.get("rheo_methods", []), ov_rheo, "rheo_method_id")
-    data["suppliers"] = _merge(data.get("suppliers", []), ov_sup, "supplier_id")
-    data["formulations"] = _merge(data.get("formulations", []), ov_form, "formulation_id")
-    return data
+        return json.load(f)
 
 
 # -----------------------------
@@ -187,12 +550,87 @@ def iter_runs(limit: int = 10000) -> List[Dict[str, Any]]:
     return _read_jsonl(P_RUN, limit)
 
 
+def iter_runs_since(cursor: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], Dict[str, Any], bool]:
+    """Runs appended after `cursor` (as returned by a previous call).
+
+    Returns (runs, new_cursor, resumed). resumed is False when there was no
+    usable cursor (first call, or runs.jsonl was rewritten / replaced): the
+    runs are then the whole log. Only the bytes after the cursor are read.
+    """
+    cursor = cursor or {}
+    if _use_sqlite():
+        after = int(cursor.get("seq", 0)) if "seq" in cursor else 0
+        runs, last = _sqlite().read_log_since(P_RUN, after)
+        return runs, {"seq": last}, "seq" in cursor
+    try:
+        st = os.stat(P_RUN)
+    except FileNotFoundError:
+        return [], {"inode": None, "offset": 0}, False
+    offset = cursor.get("offset")
+    resumed = cursor.get("inode") == st.st_ino and isinstance(offset, int) and 0 <= offset <= st.st_size
+    start = offset if resumed else 0
+    with open(P_RUN, "rb") as f:
+        f.seek(start)
+        chunk = f.read(st.st_size - start)
+    end = chunk.rfind(b"\n") + 1  # a trailing partial line waits for the next call
+    return _parse_jsonl_bytes(chunk[:end]), {"inode": st.st_ino, "offset": start + end}, resumed
+
+
 def append_model(rec: Dict[str, Any]) -> None:
     _append_jsonl(P_MODEL, rec)
+    _modeling().invalidate_prediction_cache()
+    if not _use_sqlite():
+        _model_registry().refresh(persist=True)
+
+
+def save_model(model: Dict[str, Any]) -> Dict[str, Any]:
+    """Persist a trained model: weights/schema to MODEL_DIR/<model_id>.npz, a metadata row to models.jsonl.
+
+    Successful fits are also recorded in admin model_runs with the same artifact_path.
+    Returns the metadata row that was appended.
+    """
+    if not model.get("ok"):
+        # failed fits carry no weights; keep them as a plain row
+        append_model(model)
+        return model
+    model_id = str(model.get("model_id") or datetime.utcnow().strftime("MODEL-%Y%m%d-%H%M%S-") + uuid4().hex[:8])
+    artifact = MODEL_DIR / f"{model_id}.npz"
+    _modeling().save_model_artifact(dict(model, model_id=model_id), artifact)
+    rel = artifact.relative_to(ROOT).as_posix()
+    is_array_key = _modeling().is_array_key
+    row = {k: v for k, v in model.items() if k != "schema" and not is_array_key(k)}
+    row.update({"model_id": model_id, "artifact_path": rel, "artifact_format": "npz"})
+    append_model(row)
+    upsert_model_run({
+        "model_run_id": model_id,
+        "model_name": model.get("model_type", ""),
+        "target": ",".join(k[len("weights_"):] for k in model if k.startswith("weights_")),
+        "feature_set_version": "v1",
+        "train_run_ids": [],
+        "metrics_json": {k: v for k, v in model.items() if k.startswith("rmse_")},
+        "artifact_path": rel,
+        "trained_at": row.get("timestamp_utc") or datetime.utcnow().isoformat(),
+    })
+    return row
+
+
+def load_model(row: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Attach weights and schema from a row's artifact (mmap); inline legacy rows pass through."""
+    if not row or not row.get("artifact_path") or "schema" in row:
+        return row
+    path = Path(row["artifact_path"])
+    if not path.is_absolute():
+        path = ROOT / path
+    try:
+        loaded = _modeling().load_model_artifact(path)
+    except (OSError, ValueError, KeyError):
+        return row
+    loaded.update(row)
+    return loaded
 
 
 def iter_models(limit: int = 2000) -> List[Dict[str, Any]]:
-    return _read_jsonl(P_MODEL, limit)
+    return _read_jsonl(P_MODEL, limit, tail=True)
 
 
 def append_qc_feedback(rec: Dict[str, Any]) -> None:
@@ -217,12 +655,69 @@ def iter_batch_sop_locks(limit: int = 10000) -> List[Dict[str, Any]]:
     return _read_jsonl(P_SOP_LOCKS, limit)
 
 
+# Model registry: models.jsonl.idx maps model_type -> byte offset (and model_id) of
+# its newest record. append_model keeps it current; records appended by other
+# processes are picked up by the same incremental refresh.
+
+def _model_registry() -> _PkIndex:
+    return _pk_index(P_MODEL, "model_type", meta_key="model_id")
+
+
+def model_registry() -> Dict[str, Dict[str, Any]]:
+    """model_type -> {"model_id", "offset"} of the newest models.jsonl record."""
+    reg = _model_registry()
+    offsets = reg.refresh()
+    with reg.lock:
+        return {t: {"model_id": reg.meta.get(t), "offset": off} for t, off in offsets.items()}
+
+
+# model_type -> (registry pointer, loaded model); reused until the pointer moves.
+_MODEL_CACHE: Dict[str, Tuple[Any, Dict[str, Any]]] = {}
+
+
 def get_latest_model(model_type: str = "surrogate_v1") -> Optional[Dict[str, Any]]:
-    latest = None
-    for m in iter_models(limit=5000):
+    """Newest live model of a type, O(1) via the registry plus an in-process cache.
+
+    The returned record is shared between callers; treat it as read-only.
+    """
+    if _use_sqlite():
+        pointer: Any = ("sqlite", str(SQLITE_PATH), _sqlite().table_version(P_MODEL), table_version(P_MODEL))
+        hit = _MODEL_CACHE.get(model_type)
+        if hit is not None and hit[0] == pointer:
+            return hit[1]
+        m = _sqlite().latest_model(P_MODEL, model_type)
+    else:
+        reg = _model_registry()
+        offset = reg.refresh().get(model_type)
+        if offset is None:
+            return None
+        pointer = (reg.inode, offset)
+        hit = _MODEL_CACHE.get(model_type)
+        if hit is not None and hit[0] == pointer:
+            return hit[1]
+        m = _read_at_offsets(P_MODEL, [offset])[0]
+        if m is None or m.get("model_type") != model_type or m.get("is_deleted", False):
+            # newest record is a tombstone (or unreadable): fall back to the scan
+            m = _scan_latest_model(model_type)
+    m = load_model(m)
+    prev = _MODEL_CACHE.get(model_type)
+    if prev is not None and m is not None and prev[1].get("model_id") != m.get("model_id"):
+        # registered by another process since we last looked
+        _modeling().invalidate_prediction_cache()
+    if m is not None:
+        _MODEL_CACHE[model_type] = (pointer, m)
+    return m
+
+
+def _scan_latest_model(model_type: str) -> Optional[Dict[str, Any]]:
+    # Walk models.jsonl newest-first and stop at the first live match
+    # (same 5000-record horizon as before).
+    for i, m in enumerate(_iter_jsonl_reverse(P_MODEL)):
+        if i >= 5000:
+            break
         if m.get("model_type") == model_type and not m.get("is_deleted", False):
-            latest = m
-    return latest
+            return m
+    return None
 
 
 # -----------------------------
@@ -234,45 +729,544 @@ def _composite_id(*parts: Any) -> str:
 
 
 def _load_table(path: Path, id_key: str, limit: int = 20000) -> List[Dict[str, Any]]:
-    records = _read_jsonl(path, limit=limit)
+    if _use_sqlite():
+        return _sqlite().load_table(path, limit=limit)
+    records = _read_jsonl(path, limit=limit, shared=True)
     latest = _latest_by_id(records, id_key)
+    _maybe_compact(path, id_key, n_records=len(records), n_live=len(latest))
     return list(latest.values())
 
 
-def load_admin_db() -> Dict[str, Any]:
+def _load_table_in_process(path: Path, id_key: str, backend: str, sqlite_path: Path) -> List[Dict[str, Any]]:
+    # Process-pool entry point: a spawned worker does not inherit set_storage_backend().
+    set_storage_backend(backend, sqlite_path)
+    return _load_table(path, id_key)
+
+
+def load_admin_db(
+    tables: Optional[List[str]] = None,
+    executor: str = "thread",
+    max_workers: Optional[int] = None,
+) -> Dict[str, Any]:
     """Load the redesigned Admin Database (Row1–Row6).
 
     This does NOT affect the recipe engine.
+    `tables` restricts the load to the named tables (keys of get_admin_paths()).
+    Tables are read concurrently: executor="thread" overlaps file I/O and reuses
+    this process's incremental readers; "process" parallelises a CPU-bound cold
+    parse across cores; "serial" reads them one after another. On the SQLite
+    backend "thread" loads serially on the calling thread's connection, since
+    reads of one database gain little from threads.
+    Unchanged tables are served from the process-wide load cache; only tables
+    whose file (or version counter) changed since the last call are re-read.
+    Rows are deep-copied on the way out, so callers may mutate them freely.
+    """
+    specs = get_admin_paths()
+    names = list(specs) if tables is None else [n for n in specs if n in set(tables)]
+    unknown = set(tables or []) - set(specs)
+    if unknown:
+        raise KeyError(f"Unknown admin table(s): {', '.join(sorted(unknown))}")
+    sigs = {n: _table_signature(specs[n][0]) for n in names}
+    out: Dict[str, Any] = {}
+    with _CACHE_LOCK:
+        for n in names:
+            hit = _LOAD_CACHE.get("admin:" + n)
+            if hit is not None and hit[0] == sigs[n]:
+                out[n] = hit[1]
+    stale = [n for n in names if n not in out]
+    if stale:
+        fresh = _load_tables(specs, stale, executor, max_workers)
+        with _CACHE_LOCK:
+            for n, rows in fresh.items():
+                _LOAD_CACHE["admin:" + n] = (sigs[n], rows)
+        out.update(fresh)
+    return {n: copy.deepcopy(out[n]) for n in names}
+
+
+def _load_tables(
+    specs: Dict[str, Tuple[Path, str]], names: List[str], executor: str, max_workers: Optional[int]
+) -> Dict[str, List[Dict[str, Any]]]:
+    if executor == "serial" or len(names) <= 1 or (executor == "thread" and _use_sqlite()):
+        return {n: _load_table(*specs[n]) for n in names}
+    workers = max_workers or min(len(names), (os.cpu_count() or 1) + 4)
+    if executor == "process":
+        with ProcessPoolExecutor(max_workers=min(workers, os.cpu_count() or 1)) as pool:
+            futures = {
+                n: pool.submit(_load_table_in_process, specs[n][0], specs[n][1], STORAGE_BACKEND, SQLITE_PATH)
+                for n in names
+            }
+            return {n: futures[n].result() for n in names}
+    if executor != "thread":
+        raise ValueError(f"Unknown executor: {executor}")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {n: pool.submit(_load_table, *specs[n]) for n in names}
+        return {n: futures[n].result() for n in names}
+
+
+# Primary-key index: point lookups without materialising the table
+
+class _PkIndex:
+    """Sidecar index (<table>.jsonl.idx) mapping primary key -> byte offset of its latest record.
+
+    The sidecar records the inode and the byte offset it covers; refresh() only
+    scans lines appended after that offset (so writes from other sessions are
+    picked up too) and rebuilds from scratch when the inode changed (compaction).
     """
+
+    def __init__(self, path: Path, id_key: str, meta_key: Optional[str] = None):
+        self.path = path
+        self.id_key = id_key
+        # optional field of the latest record kept next to its offset (e.g. model_id)
+        self.meta_key = meta_key
+        self.sidecar = path.with_name(path.name + ".idx")
+        self.lock = threading.Lock()
+        self.offsets: Dict[str, int] = {}
+        self.meta: Dict[str, Any] = {}
+        self.inode: Optional[int] = None
+        self.upto = 0
+        self._loaded = False
+
+    def _load_sidecar(self) -> None:
+        self._loaded = True
+        try:
+            with self.sidecar.open("r", encoding="utf-8") as f:
+                obj = json.load(f)
+            if obj.get("id_key") == self.id_key and obj.get("meta_key") == self.meta_key:
+                self.offsets = {str(k): int(v) for k, v in (obj.get("offsets") or {}).items()}
+                self.meta = dict(obj.get("meta") or {})
+                self.inode = obj.get("inode")
+                self.upto = int(obj.get("upto", 0))
+        except (OSError, ValueError):
+            pass
+
+    def _persist(self) -> None:
+        # unique temp file: other processes may be persisting the same sidecar
+        fd, tmp = tempfile.mkstemp(prefix=self.sidecar.name + ".", suffix=".tmp", dir=str(self.sidecar.parent))
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                os.fchmod(f.fileno(), 0o644)  # mkstemp creates 0600
+                json.dump({
+                    "id_key": self.id_key, "meta_key": self.meta_key, "inode": self.inode,
+                    "upto": self.upto, "offsets": self.offsets, "meta": self.meta,
+                }, f)
+            os.replace(tmp, self.sidecar)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def refresh(self, persist: bool = False) -> Dict[str, int]:
+        with self.lock:
+            if not self._loaded:
+                self._load_sidecar()
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                self.offsets, self.meta, self.inode, self.upto = {}, {}, None, 0
+                return self.offsets
+            if st.st_ino != self.inode or st.st_size < self.upto:
+                self.offsets, self.meta, self.inode, self.upto = {}, {}, st.st_ino, 0
+            changed = False
+            if st.st_size > self.upto:
+                with open(self.path, "rb") as f:
+                    f.seek(self.upto)
+                    chunk = f.read()
+                pos = 0
+                while True:
+                    nl = chunk.find(b"\n", pos)
+                    if nl < 0:
+                        break
+                    line = chunk[pos:nl].strip()
+                    if line:
+                        try:
+                            rec = json.loads(line)
+                        except Exception:
+                            rec = {}
+                        _id = rec.get(self.id_key)
+                        if _id is not None:
+                            self.offsets[str(_id)] = self.upto + pos
+                            if self.meta_key:
+                                self.meta[str(_id)] = rec.get(self.meta_key)
+                    pos = nl + 1
+                changed = pos > 0
+                self.upto += pos
+            if persist and changed:
+                try:
+                    self._persist()
+                except OSError:
+                    pass
+            return self.offsets
+
+    def rebuild(self, persist: bool = False) -> Dict[str, int]:
+        """Drop the in-memory and sidecar state and rescan the table from the start."""
+        with self.lock:
+            self._loaded = True
+            self.offsets, self.meta, self.inode, self.upto = {}, {}, None, 0
+        return self.refresh(persist=persist)
+
+
+_PK_INDEXES: Dict[str, _PkIndex] = {}
+
+
+def _pk_index(path: Path, id_key: str, meta_key: Optional[str] = None) -> _PkIndex:
+    key = str(path)
+    with _READERS_LOCK:
+        idx = _PK_INDEXES.get(key)
+        if idx is None or idx.id_key != id_key or idx.meta_key != meta_key:
+            idx = _PK_INDEXES[key] = _PkIndex(path, id_key, meta_key)
+        return idx
+
+
+def _read_at_offsets(path: Path, offsets: List[int]) -> List[Optional[Dict[str, Any]]]:
+    out: List[Optional[Dict[str, Any]]] = []
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return [None] * len(offsets)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for off in offsets:
+                end = mm.find(b"\n", off)
+                try:
+                    out.append(json.loads(mm[off: end if end >= 0 else size]))
+                except Exception:
+                    out.append(None)
+    return out
+
+
+def get_many(table: str, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Fetch live records of one admin table by primary key (missing/deleted ids are omitted).
+
+    Uses the sidecar byte-offset index and reads only the requested lines via mmap,
+    so the cost does not grow with the table's edit history. Each line read is checked
+    against the requested id; on a mismatch the index is rebuilt and the lookup retried once.
+    """
+    path, id_key = get_admin_paths()[table]
+    if _use_sqlite():
+        return _sqlite().get_by_ids(path, [str(i) for i in ids])
+    idx = _pk_index(path, id_key)
+    offsets = idx.refresh()
+    for attempt in range(2):
+        wanted = [(str(i), offsets[str(i)]) for i in ids if str(i) in offsets]
+        if not wanted:
+            return {}
+        recs = _read_at_offsets(path, [off for _, off in wanted])
+        # a stale offset (file rewritten under the index) lands on someone else's line
+        if all(rec is not None and str(rec.get(id_key)) == _id for (_id, _), rec in zip(wanted, recs)):
+            break
+        if attempt == 0:
+            offsets = idx.rebuild(persist=True)
     return {
-        "suppliers2": _load_table(P2_SUPPLIERS, "supplier_company_id"),
-        "supplier_contacts": _load_table(P2_CONTACTS, "contact_id"),
-        "materials2": _load_table(P2_MATERIALS, "material_id"),
-        "supplier_materials": _load_table(P2_SUPPLIER_MATERIALS, "supplier_material_id"),
-        "strain_products": _load_table(P2_STRAIN_PRODUCTS, "strain_product_id"),
-        "strain_components": _load_table(P2_STRAIN_COMPONENTS, "strain_component_id"),
-        "material_lots": _load_table(P2_MATERIAL_LOTS, "lot_id"),
-        "rheo_setups": _load_table(P2_RHEO_SETUPS, "rheo_setup_id"),
-        "formulations2": _load_table(P2_FORMULATIONS, "formulation_id"),
-        "formulation_lines": _load_table(P2_FORM_LINES, "line_id"),
-        "processes": _load_table(P2_PROCESSES, "process_id"),
-        "runs2": _load_table(P2_RUNS, "run_id"),
-        "run_results": _load_table(P2_RESULTS, "run_id"),
-        "model_runs": _load_table(P2_MODEL_RUNS, "model_run_id"),
-        "model_predictions": _load_table(P2_MODEL_PRED, "prediction_id"),
+        _id: rec for (_id, _), rec in zip(wanted, recs)
+        if rec is not None and str(rec.get(id_key)) == _id and not rec.get("is_deleted", False)
     }
 
 
+def get_by_id(table: str, _id: str) -> Optional[Dict[str, Any]]:
+    """Fetch one live admin record by primary key, e.g. get_by_id("runs2", "RUN2-...")."""
+    return get_many(table, [_id]).get(str(_id))
+
+
+# Secondary (foreign-key) indexes: joins in O(matches)
+
+# Admin table -> foreign-key fields indexed by find_by() and the join helpers below.
+FK_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "supplier_contacts": ("supplier_company_id",),
+    "supplier_materials": ("supplier_company_id", "material_id"),
+    "strain_components": ("strain_product_id",),
+    "material_lots": ("material_id", "strain_product_id"),
+    "formulation_lines": ("formulation_id", "lot_id"),
+    "runs2": ("formulation_id", "process_id"),
+    "model_predictions": ("model_run_id", "run_id"),
+}
+
+
+class _FkIndex:
+    """In-memory value -> primary keys maps for the FK fields of one admin table.
+
+    Built lazily on first use from the table's incremental reader and refreshed
+    by replaying only the records appended since (an edit moves the key to its
+    new bucket, a tombstone removes it). A reader rescan (compaction, rotation)
+    triggers a rebuild.
+    """
+
+    def __init__(self, path: Path, id_key: str, fields: Tuple[str, ...]):
+        self.path = path
+        self.id_key = id_key
+        self.fields = fields
+        self.lock = threading.Lock()
+        self.rows: Dict[str, Dict[str, Any]] = {}
+        self.buckets: Dict[str, Dict[str, Dict[str, None]]] = {f: {} for f in fields}
+        self.generation = -1
+        self.seen = 0
+
+    def _apply(self, rec: Dict[str, Any]) -> None:
+        _id = rec.get(self.id_key)
+        if _id is None:
+            return
+        _id = str(_id)
+        old = self.rows.pop(_id, None)
+        if old is not None:
+            for f in self.fields:
+                v = old.get(f)
+                if v is not None:
+                    bucket = self.buckets[f].get(str(v))
+                    if bucket is not None:
+                        bucket.pop(_id, None)
+                        if not bucket:
+                            del self.buckets[f][str(v)]
+        if rec.get("is_deleted", False):
+            return
+        self.rows[_id] = rec
+        for f in self.fields:
+            v = rec.get(f)
+            if v is not None:
+                self.buckets[f].setdefault(str(v), {})[_id] = None
+
+    def refresh(self) -> "_FkIndex":
+        reader = _reader(self.path)
+        reader.refresh()
+        with reader.lock:
+            records, generation = reader.records, reader.generation
+            n = len(records)
+        with self.lock:
+            if generation != self.generation or n < self.seen:
+                self.rows = {}
+                self.buckets = {f: {} for f in self.fields}
+                self.generation, self.seen = generation, 0
+            for rec in records[self.seen:n]:
+                self._apply(rec)
+            self.seen = n
+        return self
+
+    def lookup(self, field: str, values: List[Any]) -> List[Dict[str, Any]]:
+        with self.lock:
+            out: List[Dict[str, Any]] = []
+            seen: set = set()
+            for v in values:
+                for _id in self.buckets[field].get(str(v), ()):
+                    if _id not in seen:
+                        seen.add(_id)
+                        out.append(self.rows[_id])
+        # rows are shared with the reader's cache; callers get their own copies
+        return copy.deepcopy(out)
+
+
+_FK_INDEXES: Dict[str, _FkIndex] = {}
+
+
+def _fk_index(table: str) -> _FkIndex:
+    path, id_key = get_admin_paths()[table]
+    with _READERS_LOCK:
+        idx = _FK_INDEXES.get(str(path))
+        if idx is None:
+            idx = _FK_INDEXES[str(path)] = _FkIndex(path, id_key, FK_FIELDS[table])
+    return idx.refresh()
+
+
+def find_by(table: str, field: str, values: List[Any]) -> List[Dict[str, Any]]:
+    """Live rows of an admin table whose `field` equals any of `values`.
+
+    `field` must be listed in FK_FIELDS[table]; cost is proportional to the
+    number of matches, not the table size.
+    """
+    if field not in FK_FIELDS.get(table, ()):
+        raise KeyError(f"No secondary index on {table}.{field}")
+    values = [v for v in values if v is not None and v != ""]
+    if not values:
+        return []
+    if _use_sqlite():
+        return _sqlite().find_by(get_admin_paths()[table][0], field, [str(v) for v in values])
+    return _fk_index(table).lookup(field, values)
+
+
+def lines_for_formulation(formulation_id: str) -> List[Dict[str, Any]]:
+    return find_by("formulation_lines", "formulation_id", [formulation_id])
+
+
+def lines_using_lot(lot_id: str) -> List[Dict[str, Any]]:
+    return find_by("formulation_lines", "lot_id", [lot_id])
+
+
+def lots_for_material(material_id: str) -> List[Dict[str, Any]]:
+    return find_by("material_lots", "material_id", [material_id])
+
+
+def lots_for_strain_product(strain_product_id: str) -> List[Dict[str, Any]]:
+    return find_by("material_lots", "strain_product_id", [strain_product_id])
+
+
+def materials_for_supplier(supplier_company_id: str) -> List[Dict[str, Any]]:
+    """supplier_materials rows offered by one supplier."""
+    return find_by("supplier_materials", "supplier_company_id", [supplier_company_id])
+
+
+def suppliers_for_material(material_id: str) -> List[Dict[str, Any]]:
+    """supplier_materials rows for one material."""
+    return find_by("supplier_materials", "material_id", [material_id])
+
+
+def contacts_for_supplier(supplier_company_id: str) -> List[Dict[str, Any]]:
+    return find_by("supplier_contacts", "supplier_company_id", [supplier_company_id])
+
+
+def components_for_strain_product(strain_product_id: str) -> List[Dict[str, Any]]:
+    return find_by("strain_components", "strain_product_id", [strain_product_id])
+
+
+def runs_for_formulation(formulation_id: str) -> List[Dict[str, Any]]:
+    return find_by("runs2", "formulation_id", [formulation_id])
+
+
+def runs_for_process(process_id: str) -> List[Dict[str, Any]]:
+    return find_by("runs2", "process_id", [process_id])
+
+
+def runs_using_lot(lot_id: str) -> List[Dict[str, Any]]:
+    """runs2 rows whose formulation has a line drawing on `lot_id`."""
+    fids = list(dict.fromkeys(x.get("formulation_id") for x in lines_using_lot(lot_id)))
+    return find_by("runs2", "formulation_id", fids)
+
+
+def results_for_runs(run_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """run_id -> run_results row (run_results is keyed by run_id)."""
+    return get_many("run_results", run_ids)
+
+
+def predictions_for_model_run(model_run_id: str) -> List[Dict[str, Any]]:
+    return find_by("model_predictions", "model_run_id", [model_run_id])
+
+
+def _price(rec: Dict[str, Any]) -> Optional[float]:
+    try:
+        v = float(rec.get("unit_price_per_kg"))
+    except (TypeError, ValueError):
+        return None
+    return v if v >= 0 else None
+
+
+def material_prices() -> Dict[str, float]:
+    """material_id -> unit_price_per_kg used for formulation cost.
+
+    The newest priced material lot (received / manufacture date) wins, since
+    it is what was actually paid; otherwise the cheapest supplier_materials
+    quote. Materials without any price are absent.
+    """
+    admin = load_admin_db(["supplier_materials", "material_lots"])
+    prices: Dict[str, float] = {}
+    for rec in admin.get("supplier_materials", []):
+        v, mid = _price(rec), rec.get("material_id")
+        if v is not None and mid and (mid not in prices or v < prices[mid]):
+            prices[mid] = v
+    newest: Dict[str, Tuple[str, str]] = {}
+    for rec in admin.get("material_lots", []):
+        v, mid = _price(rec), rec.get("material_id")
+        if v is None or not mid:
+            continue
+        when = (str(rec.get("received_date") or rec.get("manufacture_date") or ""), str(rec.get("timestamp_utc") or ""))
+        if mid not in newest or when >= newest[mid]:
+            newest[mid] = when
+            prices[mid] = v
+    return prices
+
+
+def ingredient_prices() -> Dict[str, float]:
+    """Legacy ingredient_id -> unit_price_per_kg, for costing engine formulations.
+
+    Admin prices are keyed by material_id; a material counts for the recipe
+    ingredient named in its ingredient_id field, or for the ingredient of the
+    same id when its material_id is a legacy ingredient_id. When several
+    materials map to one ingredient the cheapest wins. Unmapped materials are
+    ignored and unpriced ingredients are absent.
+    """
+    prices = material_prices()
+    legacy = {str(x.get("ingredient_id")) for x in load_data().get("ingredients", []) if x.get("ingredient_id")}
+    out: Dict[str, float] = {}
+    for mat in load_admin_db(["materials2"]).get("materials2", []):
+        mid = str(mat.get("material_id") or "")
+        iid = str(mat.get("ingredient_id") or "").strip()
+        if mid in prices and iid and (iid not in out or prices[mid] < out[iid]):
+            out[iid] = prices[mid]
+    for mid, v in prices.items():
+        if mid in legacy and (mid not in out or v < out[mid]):
+            out[mid] = v
+    return out
+
+
 # Generic upsert/delete for admin tables
 
 def admin_upsert(path: Path, id_key: str, rec: Dict[str, Any]) -> None:
     if id_key not in rec or not rec.get(id_key):
         raise ValueError(f"Missing primary key: {id_key}")
     _append_jsonl(path, rec)
+    if not _use_sqlite():
+        _pk_index(path, id_key).refresh(persist=True)
 
 
 def admin_delete(path: Path, id_key: str, _id: str) -> None:
     _append_jsonl(path, {id_key: _id, "is_deleted": True})
+    if not _use_sqlite():
+        _pk_index(path, id_key).refresh(persist=True)
+
+
+def admin_upsert_many(
+    path: Path, id_key: str, recs: List[Dict[str, Any]], fsync: bool = False
+) -> List[Dict[str, Any]]:
+    """Validate and upsert many admin records in a single write.
+
+    Every row is checked up front (primary key present, JSON-serialisable);
+    accepted rows are written together, rejected rows are not written at all.
+    Returns one {"index", "id", "ok", "error"} dict per input row.
+    """
+    results: List[Dict[str, Any]] = []
+    accepted: List[Dict[str, Any]] = []
+    payload: List[bytes] = []
+    for i, rec in enumerate(recs):
+        _id = rec.get(id_key) if isinstance(rec, dict) else None
+        if not _id:
+            results.append({"index": i, "id": _id, "ok": False, "error": f"Missing primary key: {id_key}"})
+            continue
+        stamped = _stamp(rec)
+        try:
+            line = _encode_line(stamped)
+        except (TypeError, ValueError) as e:
+            results.append({"index": i, "id": _id, "ok": False, "error": str(e)})
+            continue
+        accepted.append(stamped)
+        payload.append(line)
+        results.append({"index": i, "id": _id, "ok": True, "error": None})
+    if accepted:
+        if _use_sqlite():
+            _sqlite().append_records(path, accepted)
+        else:
+            _write_lines(path, b"".join(payload), fsync=fsync)
+            _pk_index(path, id_key).refresh(persist=True)
+        _bump_version(path)
+    return results
+
+
+# Composite primary keys derived from other fields when not given explicitly.
+_COMPOSITE_KEYS: Dict[str, Tuple[str, ...]] = {
+    "supplier_materials": ("supplier_company_id", "material_id"),
+    "strain_components": ("strain_product_id", "component_name"),
+}
+
+
+def _fill_composite_id(table: str, rec: Dict[str, Any]) -> Dict[str, Any]:
+    parts = _COMPOSITE_KEYS.get(table)
+    if not parts:
+        return rec
+    _, id_key = get_admin_paths()[table]
+    if rec.get(id_key):
+        return rec
+    rec = dict(rec)
+    rec[id_key] = _composite_id(*[rec.get(p) for p in parts])
+    return rec
+
+
+def upsert_many(table: str, recs: List[Dict[str, Any]], fsync: bool = False) -> List[Dict[str, Any]]:
+    """Bulk counterpart of the upsert_* helpers, addressed by admin table name."""
+    path, id_key = get_admin_paths()[table]
+    return admin_upsert_many(path, id_key, [_fill_composite_id(table, r) for r in recs], fsync=fsync)
 
 
 # Suppliers
@@ -303,9 +1297,7 @@ def delete_material2(material_id: str) -> None:
 
 def upsert_supplier_material(rec: Dict[str, Any]) -> None:
     # enforce composite key
-    if not rec.get("supplier_material_id"):
-        rec = dict(rec)
-        rec["supplier_material_id"] = _composite_id(rec.get("supplier_company_id"), rec.get("material_id"))
+    rec = _fill_composite_id("supplier_materials", rec)
     admin_upsert(P2_SUPPLIER_MATERIALS, "supplier_material_id", rec)
 
 
@@ -323,9 +1315,7 @@ def delete_strain_product(strain_product_id: str) -> None:
 
 
 def upsert_strain_component(rec: Dict[str, Any]) -> None:
-    if not rec.get("strain_component_id"):
-        rec = dict(rec)
-        rec["strain_component_id"] = _composite_id(rec.get("strain_product_id"), rec.get("component_name"))
+    rec = _fill_composite_id("strain_components", rec)
     admin_upsert(P2_STRAIN_COMPONENTS, "strain_component_id", rec)
 
 
@@ -452,3 +1442,125 @@ def get_admin_paths() -> Dict[str, Tuple[Path, str]]:
         "model_runs": (P2_MODEL_RUNS, "model_run_id"),
         "model_predictions": (P2_MODEL_PRED, "prediction_id"),
     }
+
+
+def get_legacy_paths() -> Dict[str, Tuple[Path, str]]:
+    """Return legacy overlay name -> (jsonl path, primary key)."""
+    return {
+        "strains": (P_STR, "strain_combo_id"),
+        "ingredients": (P_ING, "ingredient_id"),
+        "rheo_methods": (P_RHEO, "rheo_method_id"),
+        "suppliers": (P_SUP, "supplier_id"),
+        "formulations": (P_FORM, "formulation_id"),
+    }
+
+
+def get_log_paths() -> Dict[str, Path]:
+    """Return log name -> jsonl path for the append-only logs without a primary key."""
+    return {
+        "runs": P_RUN,
+        "models": P_MODEL,
+        "qc_feedback": P_QC_FEEDBACK,
+        "batch_sop_locks": P_SOP_LOCKS,
+    }
+
+
+# -----------------------------
+# Compaction
+# -----------------------------
+
+def compact_table(path: Path, id_key: str, keep_tombstones: bool = False) -> Dict[str, Any]:
+    """Rewrite an append-only table down to the latest record per primary key.
+
+    The file is rewritten atomically (temp file + rename). Admin tables drop
+    tombstoned ids entirely; legacy overlays pass keep_tombstones=True because
+    their tombstones still hide rows of the seed data.json.
+    Records without a primary key are kept as-is.
+    """
+    if _use_sqlite():
+        return _sqlite().compact(path, keep_tombstones=keep_tombstones)
+    # writers are held off for the whole compaction, and a concurrent compaction
+    # of the same table waits here too
+    with _file_lock(path):
+        reader = _reader(path)
+        reader.refresh()
+        with reader.lock:
+            # records and offset taken together: another thread's refresh() cannot slip between
+            records = list(reader.records)
+            read_upto = reader.offset
+
+        latest: Dict[str, int] = {}
+        for i, r in enumerate(records):
+            _id = r.get(id_key)
+            if _id is not None:
+                latest[str(_id)] = i
+        keep_idx = set(latest.values())
+        kept: List[Dict[str, Any]] = []
+        for i, r in enumerate(records):
+            if r.get(id_key) is None:
+                kept.append(r)
+            elif i in keep_idx and (keep_tombstones or not r.get("is_deleted", False)):
+                kept.append(r)
+
+        n_before = len(records)
+        n_tomb = sum(1 for r in records if r.get("is_deleted", False))
+        stats = {
+            "table": path.name,
+            "records_before": n_before,
+            "records_after": len(kept),
+            "dropped": n_before - len(kept),
+            "tombstones": n_tomb,
+            "tombstone_ratio": round(n_tomb / n_before, 4) if n_before else 0.0,
+        }
+        if not path.exists() or stats["dropped"] == 0:
+            return stats
+
+        fd, tmp = tempfile.mkstemp(prefix=path.name + ".", suffix=".compact.tmp", dir=str(path.parent))
+        try:
+            with os.fdopen(fd, "wb") as out:
+                # mkstemp creates 0600; keep the table's own permissions
+                os.fchmod(out.fileno(), path.stat().st_mode & 0o777)
+                for r in kept:
+                    out.write((json.dumps(r, ensure_ascii=False) + "\n").encode("utf-8"))
+                # carry over a trailing partial line the reader has not parsed yet
+                with path.open("rb") as src:
+                    src.seek(read_upto)
+                    out.write(src.read())
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+    return stats
+
+
+def compact_storage() -> List[Dict[str, Any]]:
+    """Compact every admin table and legacy overlay; returns one stats dict per file."""
+    out = [compact_table(p, k) for p, k in get_admin_paths().values()]
+    out += [compact_table(p, k, keep_tombstones=True) for p, k in get_legacy_paths().values()]
+    return out
+
+
+def _maybe_compact(
+    path: Path,
+    id_key: str,
+    n_records: Optional[int] = None,
+    n_live: Optional[int] = None,
+    keep_tombstones: bool = False,
+) -> None:
+    """Auto-compact when enabled and superseded/deleted records dominate the file."""
+    if not AUTO_COMPACT or _use_sqlite():
+        return
+    if n_records is None or n_live is None:
+        records = _read_jsonl(path, limit=0, shared=True)
+        n_records = len(records)
+        n_live = len({str(r.get(id_key)) for r in records if r.get(id_key) is not None})
+    if n_records < AUTO_COMPACT_MIN_RECORDS:
+        return
+    if (n_records - n_live) / n_records >= AUTO_COMPACT_DEAD_RATIO:
+        try:
+            compact_table(path, id_key, keep_tombstones=keep_tombstones)
+        except OSError:
+            pass
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""Benchmark the dense vs sparse training path of core.modeling.
+
+Synthetic runs (n_combos strain combos, n_ingredients ingredient ids, a few
+ingredients per run plus WATER) are built into X with
+build_training_matrix(sparse=False / True) and both targets are fitted with
+ridge_fit. For each size it prints build and fit time and the memory held
+by X, and checks that the dense and sparse fits agree (exit code 1 if not).
+
+    python scripts/bench_training_matrix.py --runs 10000 100000
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from core.modeling import SparseMatrix, build_training_matrix, ridge_fit  # noqa: E402
+
+
+def synthetic_runs(
+    n: int, n_combos: int = 40, n_ingredients: int = 300, per_run: int = 8, seed: int = 0
+) -> List[Dict[str, Any]]:
+    """n gated-in runs shaped like runs.jsonl rows, reproducible for a seed."""
+    rnd = random.Random(seed)
+    combos = [f"COMBO-{i:03d}" for i in range(n_combos)]
+    ings = [f"ING-{i:04d}" for i in range(n_ingredients)]
+    effect = {iid: rnd.gauss(0.0, 0.3) for iid in ings}
+    runs = []
+    for i in range(n):
+        picked = rnd.sample(ings, per_run)
+        lines = [{"ingredient_id": iid, "dosage_kg": round(rnd.uniform(0.05, 4.0), 3)} for iid in picked]
+        lines.append({"ingredient_id": "WATER", "dosage_kg": round(100.0 - sum(x["dosage_kg"] for x in lines), 3)})
+        signal = sum(effect[x["ingredient_id"]] * x["dosage_kg"] for x in lines[:-1])
+        runs.append({
+            "run_id": f"R{i}",
+            "strain_combo_id": rnd.choice(combos),
+            "formulation": {"ingredients": lines},
+            "end_ph": round(rnd.uniform(4.3, 4.8), 2),
+            "fermentation_time_h": round(rnd.uniform(5.0, 10.0), 2),
+            "rheology": {"regime": "full", "syneresis_pct": 8.0 - signal + rnd.gauss(0.0, 0.5)},
+            "quality_flags": {},
+            "sensory": {"overall": 6.0 + 0.5 * signal + rnd.gauss(0.0, 0.3)},
+        })
+    return runs
+
+
+def _nbytes(X) -> int:
+    if isinstance(X, SparseMatrix):
+        return X.rows.nbytes + X.indices.nbytes + X.data.nbytes + X.indptr.nbytes
+    return X.nbytes
+
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t0
+
+
+def bench(n: int, alpha: float, tol: float, **kw) -> bool:
+    runs = synthetic_runs(n, **kw)
+    rows = {}
+    fits = {}
+    for label, sparse in (("dense", False), ("sparse", True)):
+        (X, y_sy, y_ov, schema), t_build = _timed(lambda: build_training_matrix(runs, sparse=sparse))
+        (fit, t_fit) = _timed(lambda: (ridge_fit(X, y_sy, alpha), ridge_fit(X, y_ov, alpha)))
+        fits[label] = np.concatenate([fit[0][0], fit[1][0]])
+        rows[label] = (t_build, t_fit, _nbytes(X))
+    p = len(fits["dense"]) // 2
+    diff = float(np.max(np.abs(fits["dense"] - fits["sparse"])))
+    scale = max(1.0, float(np.max(np.abs(fits["dense"]))))
+    ok = diff <= tol * scale
+    print(f"{n:>8,} runs, p={p}")
+    for label, (t_build, t_fit, nb) in rows.items():
+        print(f"  {label:<6} build {t_build:7.3f}s  two fits {t_fit:7.3f}s  X {nb / 1e6:8.1f} MB")
+    print(f"  max |w_dense - w_sparse| = {diff:.2e}  {'OK' if ok else 'MISMATCH'}")
+    return ok
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--runs", type=int, nargs="+", default=[10_000, 100_000])
+    ap.add_argument("--combos", type=int, default=40)
+    ap.add_argument("--ingredients", type=int, default=300)
+    ap.add_argument("--per-run", type=int, default=8)
+    ap.add_argument("--alpha", type=float, default=1.0)
+    ap.add_argument("--tol", type=float, default=1e-8, help="allowed weight difference, relative to max |w|")
+    args = ap.parse_args()
+    ok = True
+    for n in args.runs:
+        ok &= bench(
+            n, args.alpha, args.tol,
+            n_combos=args.combos, n_ingredients=args.ingredients, per_run=args.per_run,
+        )
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
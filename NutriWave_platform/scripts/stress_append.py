@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""Concurrent-append stress test for the JSONL storage layer.
+
+N writer processes each upsert M records (200 B - 60 KB) into one table
+through storage.admin_upsert, i.e. the locked O_APPEND write plus the
+persisted primary-key index, while this process tails the table with the
+incremental reader. Afterwards every line is checked:
+
+  * the file holds exactly N x M lines, each a complete JSON record whose
+    payload matches its checksum (no torn or interleaved writes);
+  * every (writer, seq) pair appears exactly once;
+  * the incremental reader saw all N x M records;
+  * the in-memory and the persisted (.idx sidecar) pk index both map every
+    id to the byte offset of its own line.
+
+--no-index writes through the plain locked append (storage._append_jsonl)
+instead, to measure raw append throughput; the sidecar check is skipped.
+Runs against a scratch directory, never the app's data/. Exits non-zero on
+any failure and prints throughput.
+
+    python scripts/stress_append.py --writers 8 --records 500
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import multiprocessing as mp
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from core import storage  # noqa: E402
+
+ID_KEY = "rec_id"
+
+
+def _payload(writer: int, seq: int, min_bytes: int, max_bytes: int) -> str:
+    rnd = random.Random(writer * 1_000_003 + seq)
+    n = rnd.randint(min_bytes, max_bytes)
+    return f"{rnd.getrandbits(4 * n):0{n}x}"
+
+
+def _writer(path: str, writer: int, records: int, min_bytes: int, max_bytes: int, index: bool, start) -> None:
+    write = (lambda p, rec: storage.admin_upsert(p, ID_KEY, rec)) if index else storage._append_jsonl
+    start.wait()
+    for seq in range(records):
+        body = _payload(writer, seq, min_bytes, max_bytes)
+        write(Path(path), {
+            ID_KEY: f"W{writer}-{seq}",
+            "writer": writer,
+            "seq": seq,
+            "body": body,
+            "sha1": hashlib.sha1(body.encode("utf-8")).hexdigest(),
+        })
+
+
+def _check_file(path: Path, writers: int, records: int) -> tuple:
+    errors = []
+    seen = set()
+    offsets = {}
+    pos = 0
+    raw = path.read_bytes()
+    lines = raw.split(b"\n")
+    if lines and lines[-1] == b"":
+        lines.pop()
+    else:
+        errors.append("file does not end with a newline")
+    for n, line in enumerate(lines):
+        try:
+            rec = json.loads(line)
+        except ValueError:
+            errors.append(f"line {n + 1}: not valid JSON ({len(line)} bytes)")
+            pos += len(line) + 1
+            continue
+        body = rec.get("body", "")
+        if hashlib.sha1(body.encode("utf-8")).hexdigest() != rec.get("sha1"):
+            errors.append(f"line {n + 1}: payload does not match its checksum")
+        key = (rec.get("writer"), rec.get("seq"))
+        if key in seen:
+            errors.append(f"line {n + 1}: duplicate record {key}")
+        seen.add(key)
+        offsets[str(rec.get(ID_KEY))] = pos
+        pos += len(line) + 1
+    expected = writers * records
+    if len(lines) != expected:
+        errors.append(f"{len(lines)} lines, expected {expected}")
+    missing = {(w, s) for w in range(writers) for s in range(records)} - seen
+    if missing:
+        errors.append(f"{len(missing)} records missing, e.g. {sorted(missing)[:3]}")
+    return errors, offsets, len(raw)
+
+
+def _check_index(offsets: dict, label: str, index_offsets: dict) -> list:
+    errors = []
+    if index_offsets != offsets:
+        wrong = [k for k in offsets if index_offsets.get(k) != offsets[k]]
+        extra = set(index_offsets) - set(offsets)
+        errors.append(f"{label}: {len(wrong)} wrong/missing offsets, {len(extra)} unknown ids")
+    return errors
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--writers", "-n", type=int, default=8, help="writer processes (N)")
+    ap.add_argument("--records", "-m", type=int, default=500, help="records per writer (M)")
+    ap.add_argument("--min-bytes", type=int, default=200)
+    ap.add_argument("--max-bytes", type=int, default=60_000)
+    ap.add_argument("--no-index", action="store_true", help="plain locked appends, no pk index upkeep")
+    ap.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    args = ap.parse_args()
+
+    scratch = Path(tempfile.mkdtemp(prefix="nw-stress-"))
+    path = scratch / "stress.jsonl"
+    ctx = mp.get_context("spawn")
+    start = ctx.Event()
+    procs = [
+        ctx.Process(target=_writer, args=(
+            str(path), w, args.records, args.min_bytes, args.max_bytes, not args.no_index, start,
+        ))
+        for w in range(args.writers)
+    ]
+    try:
+        for p in procs:
+            p.start()
+        reader = storage._reader(path)
+        polls = 0
+        t0 = time.perf_counter()
+        start.set()
+        while any(p.is_alive() for p in procs):
+            reader.refresh()
+            polls += 1
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - t0
+        failed = [p.exitcode for p in procs if p.exitcode != 0]
+        seen_by_reader = len(reader.refresh())
+
+        errors, offsets, size = _check_file(path, args.writers, args.records)
+        if failed:
+            errors.append(f"{len(failed)} writer process(es) failed: exit codes {failed}")
+        expected = args.writers * args.records
+        if seen_by_reader != expected:
+            errors.append(f"incremental reader saw {seen_by_reader} records, expected {expected}")
+        errors += _check_index(offsets, "pk index", dict(storage._pk_index(path, ID_KEY).refresh()))
+        if not args.no_index:
+            errors += _check_index(offsets, "pk index sidecar", dict(storage._PkIndex(path, ID_KEY).refresh()))
+
+        print(f"writers={args.writers} records/writer={args.records} lines={len(offsets)} "
+              f"size={size / 1e6:.1f} MB reader polls={polls}")
+        print(f"elapsed {elapsed:.2f}s  {expected / elapsed:,.0f} rec/s  {size / 1e6 / elapsed:,.1f} MB/s")
+        for e in errors:
+            print("FAIL:", e)
+        print("OK" if not errors else f"{len(errors)} check(s) failed")
+        return 1 if errors else 0
+    finally:
+        for p in procs:
+            if p.is_alive():
+                p.terminate()
+        if args.keep:
+            print("scratch:", scratch)
+        else:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())